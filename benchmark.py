@@ -0,0 +1,272 @@
+# benchmark.py
+
+import os
+import re
+import sys
+import io
+import time
+import argparse
+import tracemalloc
+
+from datetime import datetime
+from gedcom_transmission import GedcomTransmission
+from gedcom_date import parse_gedcom_date
+
+def generate_synthetic_gedcom(in_file, scale):
+    # Make a bigger GEDCOM transmission out of a small one by repeating all of its cross-referenced
+    # records (individuals, families, etc.) the given number of times, each copy with its own xref IDs.
+    with open(in_file, mode='r', encoding='utf-8-sig') as input_stream:
+        text = input_stream.read()
+
+    record_list = []
+    for line_text in text.splitlines(keepends=True):
+        if line_text.startswith('0 ') or len(record_list) == 0:
+            record_list.append([])
+        record_list[-1].append(line_text)
+
+    header_list = record_list[:1]
+    trailer_list = record_list[-1:]
+    xref_record_list = [record for record in record_list[1:-1] if re.match(r'0 @[^@]+@ ', record[0])]
+    other_record_list = [record for record in record_list[1:-1] if not re.match(r'0 @[^@]+@ ', record[0])]
+
+    xref_pattern = re.compile(r'@([^@\s]+)@')
+    output_stream = io.StringIO()
+    for record in header_list:
+        output_stream.write(''.join(record))
+    for i in range(scale):
+        suffix = '_%d' % i
+        for record in xref_record_list:
+            output_stream.write(xref_pattern.sub(lambda match: '@' + match.group(1) + suffix + '@', ''.join(record)))
+    for record in other_record_list + trailer_list:
+        output_stream.write(''.join(record))
+    return output_stream.getvalue()
+
+def measure(func):
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    result = func()
+    elapsed_time = time.perf_counter() - start_time
+    current_size, peak_size = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed_time, current_size, peak_size
+
+def benchmark_memory(in_file, scale):
+    print('Generating synthetic transmission at scale %d...' % scale)
+    text = generate_synthetic_gedcom(in_file, scale)
+    line_count = text.count('\n')
+    print('Synthetic transmission has %d lines (%2.2f MB of text).' % (line_count, len(text) / (1024.0 * 1024.0)))
+
+    def recv():
+        transmission = GedcomTransmission()
+        transmission.recv(io.StringIO(text))
+        return transmission
+
+    transmission, elapsed_time, current_size, peak_size = measure(recv)
+    print('recv: %2.3f sec, %2.2f MB retained, %2.2f MB peak, %d bytes per line.' % (
+        elapsed_time, current_size / (1024.0 * 1024.0), peak_size / (1024.0 * 1024.0), current_size // line_count))
+    del transmission
+
+    # The family-tree data module pulls in the rendering code, so only import it when it's needed.
+    from family_tree_data import FamilyTreeData
+
+    def from_gedcom_stream():
+        family_tree_data = FamilyTreeData()
+        family_tree_data.from_gedcom_stream(GedcomTransmission().recv_records(io.StringIO(text)))
+        return family_tree_data
+
+    family_tree_data, elapsed_time, current_size, peak_size = measure(from_gedcom_stream)
+    print('from_gedcom_stream: %2.3f sec, %2.2f MB retained, %2.2f MB peak, %d people.' % (
+        elapsed_time, current_size / (1024.0 * 1024.0), peak_size / (1024.0 * 1024.0), len(family_tree_data.person_list)))
+
+def legacy_generate_datetime(date_text):
+    # This is how dates were parsed before the date engine came along; kept here for comparison.
+    for date_format in ['%Y', 'ABT %Y', '%B %Y', '%b %Y', '%d %B %Y', '%d %b %Y']:
+        try:
+            return datetime.strptime(date_text, date_format)
+        except ValueError:
+            pass
+    return None
+
+def benchmark_dates(in_file, scale):
+    with open(in_file, mode='r', encoding='utf-8-sig') as input_stream:
+        date_text_list = [line_text.split(None, 2)[2].strip() for line_text in input_stream if line_text.split()[1:2] == ['DATE']]
+    date_text_list += ['ABT 1850', 'BEF 12 MAR 1790', 'AFT 1801', 'BET 1700 AND 1710', 'EST 1650', 'CAL 1722', '4 FEB 1699/00', 'FROM 1900 TO 1910']
+    date_text_list = date_text_list * scale
+    print('Parsing %d date values (%d distinct)...' % (len(date_text_list), len(set(date_text_list))))
+
+    start_time = time.perf_counter()
+    for date_text in date_text_list:
+        legacy_generate_datetime(date_text)
+    elapsed_time = time.perf_counter() - start_time
+    print('strptime formats: %2.3f sec, %d dates/sec.' % (elapsed_time, len(date_text_list) / elapsed_time))
+
+    parse_gedcom_date.cache_clear()
+    start_time = time.perf_counter()
+    for date_text in date_text_list:
+        date = parse_gedcom_date(date_text)
+        if date is not None:
+            date.to_datetime()
+    elapsed_time = time.perf_counter() - start_time
+    print('date engine: %2.3f sec, %d dates/sec (%s).' % (elapsed_time, len(date_text_list) / elapsed_time, parse_gedcom_date.cache_info()))
+
+    start_time = time.perf_counter()
+    for date_text in date_text_list:
+        parse_gedcom_date.__wrapped__(date_text)
+    elapsed_time = time.perf_counter() - start_time
+    print('date engine, uncached: %2.3f sec, %d dates/sec.' % (elapsed_time, len(date_text_list) / elapsed_time))
+
+def generate_synthetic_pedigree(node_count, lopsided):
+    # Make the render tree of a pedigree with the given number of persons.  A bushy pedigree fills in every ancestor
+    # generation by generation, while a lopsided one follows the paternal line back, with a few maternal ancestors
+    # at each generation.
+    from family_tree_person import MalePerson, FemalePerson
+    from render_tree import RenderNode
+
+    def make_node(person_class):
+        person = person_class()
+        person.name = 'Synthetic Person %d' % len(node_list)
+        person.family_search_id = 'S%05d' % len(node_list)
+        node_list.append(RenderNode(person=person))
+        return node_list[-1]
+
+    node_list = []
+    root_node = make_node(MalePerson)
+    queue = [root_node]
+    while len(node_list) < node_count and len(queue) > 0:
+        node = queue.pop(0)
+        node.sub_node_map['Father'] = make_node(MalePerson)
+        node.sub_node_map['Mother'] = make_node(FemalePerson)
+        if lopsided:
+            node.sub_node_map['Mother'].sub_node_map['Father'] = make_node(MalePerson)
+            node.sub_node_map['Mother'].sub_node_map['Mother'] = make_node(FemalePerson)
+            queue.append(node.sub_node_map['Father'])
+        else:
+            queue += [node.sub_node_map['Father'], node.sub_node_map['Mother']]
+    return root_node
+
+def legacy_calculate_graph_layout(node, text_metrics, font):
+    # This is how the render tree was laid out before the linear-time layout came along; kept here for comparison.
+    # Every level re-walks and re-transforms all of its descendants, so this takes time proportional to size times depth.
+    from math2d_vector import Vector
+    from math2d_affine_transform import AffineTransform
+
+    text_size = text_metrics.measure(font, node.label_string)
+    text_width = text_size[0]
+    text_height = text_size[1]
+
+    total_width = 0.0
+    margin = 2.0
+    for key in node.sub_node_map:
+        sub_node = node.sub_node_map[key]
+        legacy_calculate_graph_layout(sub_node, text_metrics, font)
+        sub_node.calculate_bounding_box()
+        total_width += sub_node.bounding_box.Width() + 2.0 * margin
+
+    location = Vector(-total_width / 2.0 + margin, -2.0 * text_height)
+    for key in node.sub_node_map:
+        sub_node = node.sub_node_map[key]
+        transform = AffineTransform()
+        upper_left_corner = Vector(sub_node.bounding_box.min_point.x, sub_node.bounding_box.max_point.y)
+        transform.Translation(location - upper_left_corner)
+        for descendant_node in sub_node.all_nodes():
+            descendant_node.label_box = transform.Transform(descendant_node.label_box)
+            descendant_node.bounding_box = transform.Transform(descendant_node.bounding_box)
+        location.x += sub_node.bounding_box.Width() + 2.0 * margin
+
+    node.label_box.min_point = Vector(-text_width / 2.0 - 3.0, -text_height / 2.0 - 3.0)
+    node.label_box.max_point = Vector(text_width / 2.0 + 3.0, text_height / 2.0 + 3.0)
+
+def benchmark_layout(in_file, scale):
+    from PIL import ImageFont
+    from render_tree import TextMetrics
+
+    font = ImageFont.truetype(os.path.join(os.path.dirname(__file__), 'JetBrainsFonts/static/JetBrainsMono-Regular.ttf'))
+
+    for lopsided in [False, True]:
+        root_node = generate_synthetic_pedigree(scale, lopsided)
+        print('%s pedigree of %d nodes:' % ('Lopsided' if lopsided else 'Bushy', root_node.calculate_size()))
+
+        # The legacy layout recurses once per generation.
+        sys.setrecursionlimit(max(sys.getrecursionlimit(), 2 * scale))
+        start_time = time.perf_counter()
+        legacy_calculate_graph_layout(root_node, TextMetrics(), font)
+        root_node.calculate_bounding_box()
+        elapsed_time = time.perf_counter() - start_time
+        print('legacy layout: %2.3f sec.' % elapsed_time)
+        legacy_box_list = [(node.label_box.min_point.x, node.label_box.min_point.y, node.label_box.max_point.x, node.label_box.max_point.y) for node in root_node.all_nodes()]
+
+        text_metrics = TextMetrics()
+        for text_metrics_state in ['cold', 'warm']:
+            start_time = time.perf_counter()
+            root_node.calculate_graph_layout(font, text_metrics)
+            root_node.calculate_bounding_box()
+            elapsed_time = time.perf_counter() - start_time
+            print('linear-time layout, %s text metrics: %2.3f sec.' % (text_metrics_state, elapsed_time))
+        box_list = [(node.label_box.min_point.x, node.label_box.min_point.y, node.label_box.max_point.x, node.label_box.max_point.y) for node in root_node.all_nodes()]
+
+        print('Layouts are %s.' % ('identical' if box_list == legacy_box_list else 'DIFFERENT'))
+
+def benchmark_kinship(in_file, scale):
+    # Tell how the given number of random pairs of people are related, first by walking the tree out from one of them
+    # until the other is found, then by way of a kinship index.  Unlike the other benchmarks, this runs on the given
+    # file as it is, since copies of a family tree are no relation to one another.
+    import random
+    from family_tree_data import FamilyTreeData
+    from family_tree_walker import FamilyTreeWalker
+    from gedcom_record_index import GedcomRecordIndex
+    from kinship_index import KinshipIndex
+
+    record_index = GedcomRecordIndex(in_file)
+    record_index.scan()
+    family_tree_data = FamilyTreeData()
+    family_tree_data.from_gedcom_record_index(record_index)
+    random.seed(0)
+    person_list = family_tree_data.person_list
+    pair_list = [(random.choice(person_list), random.choice(person_list)) for i in range(scale)]
+    print('Relating %d pairs of people out of %d...' % (len(pair_list), len(person_list)))
+
+    def visitation_func(relationship, found_list):
+        if relationship.person is found_list[0]:
+            found_list.append(relationship)
+            return False
+        return True
+
+    start_time = time.perf_counter()
+    found_count = 0
+    for person_a, person_b in pair_list:
+        walker = FamilyTreeWalker(person_a)
+        walker.avoid_inlaws = False
+        walker.visitation_func = visitation_func
+        walker.visitation_data = [person_b]
+        walker.walk()
+        if len(walker.visitation_data) > 1:
+            str(walker.visitation_data[1])
+            found_count += 1
+    elapsed_time = time.perf_counter() - start_time
+    print('walk per query: %2.3f sec, %d pairs related.' % (elapsed_time, found_count))
+
+    kinship_index = KinshipIndex(family_tree_data)
+    start_time = time.perf_counter()
+    found_count = 0
+    for person_a, person_b in pair_list:
+        if kinship_index.relate(person_a, person_b) is not None:
+            found_count += 1
+    elapsed_time = time.perf_counter() - start_time
+    print('kinship index: %2.3f sec, %d pairs related by blood or marriage to a blood relative.' % (elapsed_time, found_count))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark various parts of the family tree analyzer.')
+    parser.add_argument('--inFile', dest='in_file', help='GEDCOM file used as the seed for synthetic data.', default=os.path.join(os.path.dirname(__file__), 'spencer_gedcom_small.ged'))
+    parser.add_argument('--scale', dest='scale', help='Number of copies of the seed data to benchmark against.', type=int, default=1000)
+    parser.add_argument('--test', dest='test', help='Which benchmark to run.', choices=['memory', 'dates', 'layout', 'kinship'], default='memory')
+
+    args = parser.parse_args()
+
+    if args.test == 'memory':
+        benchmark_memory(args.in_file, args.scale)
+    elif args.test == 'dates':
+        benchmark_dates(args.in_file, args.scale)
+    elif args.test == 'layout':
+        benchmark_layout(args.in_file, args.scale)
+    elif args.test == 'kinship':
+        benchmark_kinship(args.in_file, args.scale)
@@ -3,129 +3,345 @@
 import os
 import argparse
 import sys
-import json
+import multiprocessing
 
 sys.path.append(r'C:\git_repos\pyMath2D')
 
-from family_tree_data import FamilyTreeData
+from family_tree_data import FamilyTreeData, LazyFamilyTreeData
+from family_tree_cache import FamilyTreeCache
 from family_tree_walker import FamilyTreeWalker
 from gedcom_transmission import GedcomTransmission
+from gedcom_record_index import GedcomRecordIndex
+from kinship_index import KinshipIndex
+from result_writers import create_result_writer
+from scrape_cache import ScrapeCache
 from search_results import SearchResults
+from web_scraper import WebScraper
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description='Analyze family tree data to determine persons needing LDS ordinances by proxy.')
-    parser.add_argument('--inFile', dest='in_file', help='Read the given file; typically a GEDCOM file.')
-    parser.add_argument('--outFile', dest='out_file', help='Write the given file; this can be a text file or an image file.')
-    parser.add_argument('--rootID', dest='root_id', help='Family search ID of person that is the starting-point for a search performed in the family tree.')
-    parser.add_argument('--maxResults', dest='max_search_results', help='Maximum number of people to show per result tree.')
-    parser.add_argument('--avoidInlaws', dest='avoid_inlaws', help='Avoid searching up through ancestors of in-laws.', action='store_true')
-    parser.add_argument('--avoidSpouses', dest='avoid_spouses', help='Avoid searching spouses (and therefore also children) of any ancestor.', action='store_true')
-    parser.add_argument('--webScrape', dest='web_scrape', help='Rather than generate a report, scrape search results from FamilySearch.org for additional information which can be used in subsequent invocations.', action='store_true')
-    parser.add_argument('--username', dest='username', help='Provide FamilySearch.org username for scraping.')
-    parser.add_argument('--password', dest='password', help='Provide FamilySearch.org password for scraping.')
-
-    args = parser.parse_args()
-
+def load_family_tree_data(args):
     family_tree_data = FamilyTreeData()
 
     ext = os.path.splitext(args.in_file)[1]
-    if ext == '.ged':
-        with open(args.in_file, mode='r', encoding='utf-8-sig') as input_stream:
-            print('Loading GEDCOM file %s...' % args.in_file)
-            transmission = GedcomTransmission()
-            transmission.recv(input_stream)
-            print('Building family tree data...')
-            family_tree_data.from_gedcom_transmission(transmission)
+    if ext == '.ged' and args.lazy_load:
+        print('Indexing GEDCOM file %s...' % args.in_file)
+        record_index = GedcomRecordIndex(args.in_file)
+        record_index.scan()
+        family_tree_data = LazyFamilyTreeData(record_index)
+    elif ext == '.ged':
+        family_tree_cache = FamilyTreeCache(args.in_file)
+        if not args.no_cache and family_tree_cache.load(family_tree_data):
+            print('Loaded family tree data from cache file %s.' % family_tree_cache.cache_file)
+        elif not args.no_cache:
+            # Whatever changed in the GEDCOM file since the cache was written, most of its records are probably
+            # the same as before, so only the records that changed are parsed.
+            print('Indexing GEDCOM file %s...' % args.in_file)
+            record_index = GedcomRecordIndex(args.in_file)
+            record_index.scan()
+            if args.stream_load:
+                record_index.max_block_record_count = 1
+            previous_family_tree_data = FamilyTreeData()
+            if family_tree_cache.load(previous_family_tree_data, allow_stale=True):
+                print('Re-importing changed records against stale cache file %s...' % family_tree_cache.cache_file)
+            else:
+                previous_family_tree_data = None
+                print('Building family tree data...')
+            parsed_key_list = family_tree_data.from_gedcom_record_index(record_index, previous_family_tree_data)
+            record_count = len(family_tree_data.person_record_list) + len(family_tree_data.family_record_list)
+            print('Parsed %d of %d individual and family records.' % (len(parsed_key_list), record_count))
+            print('Writing cache file %s...' % family_tree_cache.cache_file)
+            family_tree_cache.save(family_tree_data)
+        else:
+            with open(args.in_file, mode='r', encoding='utf-8-sig') as input_stream:
+                transmission = GedcomTransmission()
+                if args.stream_load:
+                    print('Streaming GEDCOM file %s...' % args.in_file)
+                    family_tree_data.from_gedcom_stream(transmission.recv_records(input_stream))
+                else:
+                    print('Loading GEDCOM file %s...' % args.in_file)
+                    transmission.recv(input_stream)
+                    print('Building family tree data...')
+                    family_tree_data.from_gedcom_transmission(transmission)
     else:
         raise Exception('Files of extension "%s" are not yet supported.' % ext)
 
-    print('Found %d people in the family tree.' % len(family_tree_data.person_list))
+    return family_tree_data
 
-    scrape_cache = {}
-    scrape_cache_file = os.path.join(os.getcwd(), 'scrape_cache.json')
-    if os.path.exists(scrape_cache_file):
-        with open(scrape_cache_file, 'r') as handle:
-            json_text = handle.read()
-            scrape_cache = json.loads(json_text)
+def load_scrape_cache(family_tree_data, scrape_cache_file):
+    scrape_cache = ScrapeCache(scrape_cache_file)
 
     for person in family_tree_data.person_list:
         person.consume_scrape_cache(scrape_cache)
 
+    return scrape_cache
+
+def find_root_person(family_tree_data, root_id):
     root_person = None
-    if args.root_id is not None:
-        key = args.root_id.upper()
-        if not key in family_tree_data.family_search_index:
+    if root_id is not None:
+        key = root_id.upper()
+        root_person = family_tree_data.find_person(key)
+        if root_person is None:
             raise Exception('No person with ID "%s" could be found in the tree.' % key)
-        root_person = family_tree_data.family_search_index[key]
 
     if root_person is None:
-        root_person = family_tree_data.person_list[0]
+        root_person = family_tree_data.first_person()
 
-    print('Root person: "%s"' % root_person.name)
+    return root_person
 
+def search_family_tree(family_tree_data, root_person, args, scrape_cache=None, result_writer=None):
     search_results = SearchResults()
     if args.max_search_results is not None:
         search_results.max_results = int(args.max_search_results)
+    elif result_writer is not None:
+        # Results written out as they're found don't make a tree that has to be kept small enough to look at.
+        search_results.max_results = -1
+    search_results.result_writer = result_writer
+    if args.tile_size is not None:
+        search_results.tile_size = args.tile_size
+    if args.render_jobs is not None:
+        search_results.render_jobs = args.render_jobs
+    if args.png_compress_level is not None:
+        search_results.png_compress_level = args.png_compress_level
+    search_results.kinship_paths = args.kinship_paths
+    if args.rank_by is not None:
+        search_results.rank_by = args.rank_by
 
+    # The walk stops as soon as every search group has all the results it wants, before anyone else is expanded.
     def visitation_func(relationship, search_results):
-        if search_results.max_results_reached():
-            return False
         search_results.conditionally_accumulate(relationship)
-        return True
+        return not search_results.max_results_reached()
 
-    print('Searching for deceased relatives needing proxy work...')
     walker = FamilyTreeWalker(root_person)
+    if args.lazy_load:
+        # Persons are only loaded as the walk reaches them, so the search criteria are evaluated one person at a time.
+        def load_func(person):
+            family_tree_data.load_person(person)
+            if scrape_cache is not None:
+                person.consume_scrape_cache(scrape_cache)
+        walker.load_func = load_func
+    else:
+        print('Evaluating search criteria...')
+        search_results.prepare_batch(family_tree_data.get_graph())
+
+    print('Searching for deceased relatives needing proxy work...')
     walker.visitation_func = visitation_func
     walker.visitation_data = search_results
     walker.avoid_inlaws = args.avoid_inlaws
     walker.avoid_spouses = args.avoid_spouses
-    walker.walk()
+    if args.max_path_length is not None:
+        walker.max_relationship_path_length = args.max_path_length
+    if args.spouse_cost is not None:
+        walker.edge_cost_map = {'spouse': args.spouse_cost}
+    search_results.begin_accumulation()
+    if not search_results.max_results_reached():
+        walker.walk()
+    search_results.finish_accumulation()
 
-    if args.web_scrape:
-        print('Web scraping search results...')
+    return search_results
+
+def generate_report(search_results, out_file, root_person, use_optimal_paths=True):
+    print('Generating report file "%s"...' % out_file)
+    ext = os.path.splitext(out_file)[1]
+    if ext == '.txt':
+        search_results.generate_text_file(out_file)
+    elif ext == '.csv':
+        search_results.generate_csv_file(out_file)
+    elif ext == '.png':
+        search_results.generate_png_files(out_file, root_person, use_optimal_paths)
+    elif ext == '.svg':
+        search_results.generate_svg_files(out_file, root_person, use_optimal_paths)
+    else:
+        raise Exception('File extension "%s" not supported.' % ext)
+
+# In batch mode, each worker process searches from one root person at a time, all using the same family tree data.
+# Wherever processes can be forked (not on Windows), they are, so that the workers simply inherit the parent's copy
+# of the data, loaded once.  Otherwise, each worker loads the binary cache that the parent has just made sure is up
+# to date, which is much quicker than parsing the GEDCOM file; that's why --noCache is refused there, unless only
+# one process is used, in which case the searches are simply done in the parent.
+batch_state = {}
+
+def create_batch_context(args):
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    if args.no_cache:
+        raise Exception('Without the binary cache, several root persons can only be searched from using one process here (--jobs 1).')
+    return multiprocessing.get_context()
+
+def init_batch_worker(args):
+    if 'family_tree_data' not in batch_state:
+        family_tree_data = FamilyTreeData()
+        if not FamilyTreeCache(args.in_file).load(family_tree_data):
+            raise Exception('The cache file of %s could not be loaded; has the GEDCOM file changed?' % args.in_file)
+        load_scrape_cache(family_tree_data, os.path.join(os.getcwd(), 'scrape_cache.db')).close()
+        batch_state['family_tree_data'] = family_tree_data
+    batch_state['args'] = args
+
+def run_batch_search(root_id):
+    family_tree_data = batch_state['family_tree_data']
+    args = batch_state['args']
+    root_person = find_root_person(family_tree_data, root_id)
+    print('Root person: "%s"' % root_person.name)
+    path, ext = os.path.splitext(args.out_file)
+    out_file = '%s_%s%s' % (path, root_id.upper(), ext)
+    result_writer = create_result_writer(out_file)
+    if result_writer is not None:
+        try:
+            search_family_tree(family_tree_data, root_person, args, result_writer=result_writer)
+        finally:
+            result_writer.close()
+    else:
+        search_results = search_family_tree(family_tree_data, root_person, args)
+        # Batch workers can't have processes of their own, and are already running in parallel anyway.
+        search_results.render_jobs = 1
+        generate_report(search_results, out_file, root_person, not args.all_connections)
+    return root_id, out_file
 
-        # Add directory to path where web-driver executables can be found for Selenium.
-        # These are servers that act as the intermediary/abstraction-layer between our
-        # script (which uses the selenium API) and the actual browser.
-        web_drivers_dir = os.path.join(os.getcwd(), 'web_drivers')
-        path = os.environ['PATH']
-        path_list = path.split(';')
-        path_list.append(web_drivers_dir)
-        path = ';'.join(path_list)
-        os.environ['PATH'] = path
+def read_root_id_list(args):
+    root_id_list = []
+    if args.root_id_list is not None:
+        root_id_list += [root_id.strip() for root_id in args.root_id_list.split(',') if len(root_id.strip()) > 0]
+    if args.root_id_file is not None:
+        with open(args.root_id_file, 'r') as handle:
+            for line in handle:
+                root_id = line.split('#')[0].strip()
+                if len(root_id) > 0:
+                    root_id_list.append(root_id)
+    return root_id_list
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Analyze family tree data to determine persons needing LDS ordinances by proxy.')
+    parser.add_argument('--inFile', dest='in_file', help='Read the given file; typically a GEDCOM file.')
+    parser.add_argument('--outFile', dest='out_file', help='Write the given file; this can be a text file, a CSV file, or a PNG or SVG image file.')
+    parser.add_argument('--rootID', dest='root_id', help='Family search ID of person that is the starting-point for a search performed in the family tree.')
+    parser.add_argument('--maxResults', dest='max_search_results', help='Maximum number of people to show per result tree; text and CSV reports list everyone found unless this is given.')
+    parser.add_argument('--rankBy', dest='rank_by', help='Which people to keep when more are found than the maximum number of results: the closest ("distance", the default), or those already known to have ordinance work available, then the closest ("readiness").', choices=['distance', 'readiness'])
+    parser.add_argument('--avoidInlaws', dest='avoid_inlaws', help='Avoid searching up through ancestors of in-laws.', action='store_true')
+    parser.add_argument('--avoidSpouses', dest='avoid_spouses', help='Avoid searching spouses (and therefore also children) of any ancestor.', action='store_true')
+    parser.add_argument('--webScrape', dest='web_scrape', help='Rather than generate a report, scrape search results from FamilySearch.org for additional information which can be used in subsequent invocations.', action='store_true')
+    parser.add_argument('--username', dest='username', help='Provide FamilySearch.org username for scraping.')
+    parser.add_argument('--password', dest='password', help='Provide FamilySearch.org password for scraping.')
+    parser.add_argument('--scrapeSessions', dest='scrape_sessions', help='Number of browser sessions to scrape with at the same time; defaults to 2.', type=int)
+    parser.add_argument('--scrapeRate', dest='scrape_rate', help='Most pages per second to load while scraping, over all sessions; defaults to 0.5.', type=float)
+    parser.add_argument('--scrapeURL', dest='scrape_url', help='URL of the ordinances page of a person, with %%s where the family search ID goes; e.g., to scrape a local stand-in for the website.')
+    parser.add_argument('--loginURL', dest='login_url', help='URL of the page to sign in from before scraping.')
+    parser.add_argument('--scrapeMaxAge', dest='scrape_max_age', help='Don\'t scrape people again that were scraped no more than this many days ago; defaults to 7, and -1 scrapes everyone.', type=float)
+    parser.add_argument('--stopAfterReady', dest='stop_after_ready', help='Stop scraping once this many people are known to have ordinance work available.', type=int)
+    parser.add_argument('--streamLoad', dest='stream_load', help='Build the family tree while the GEDCOM file is being read, one record at a time, rather than after reading all of it or blocks of it; this uses much less memory on large files.', action='store_true')
+    parser.add_argument('--maxPathLength', dest='max_path_length', help='Do not search for relatives further away than this many steps (parent, spouse or child) from the root person.', type=int)
+    parser.add_argument('--spouseCost', dest='spouse_cost', help='Weigh each step through a spouse as this many steps when deciding who the closest relatives are.', type=float)
+    parser.add_argument('--rootIDs', dest='root_id_list', help='Comma-separated family search IDs of several root persons; a separate report is generated for each of them.')
+    parser.add_argument('--rootIDFile', dest='root_id_file', help='File listing family search IDs of root persons, one per line; a separate report is generated for each of them.')
+    parser.add_argument('--jobs', dest='jobs', help='Number of processes to use when searching from several root persons; defaults to the number of CPUs.  Where processes can\'t be forked (e.g., on Windows), each one loads the binary cache, so more than one can\'t be used with --noCache.', type=int)
+    parser.add_argument('--tileSize', dest='tile_size', help='Largest width or height in pixels of an image file; bigger trees are written as several tiles of at most this size.', type=int)
+    parser.add_argument('--renderJobs', dest='render_jobs', help='Number of processes used to render the search groups to image files; defaults to one per group, up to the number of CPUs.', type=int)
+    parser.add_argument('--pngCompressLevel', dest='png_compress_level', help='PNG compression level from 0 (fastest, biggest files) to 9 (slowest, smallest files); defaults to 6.', type=int, choices=range(10))
+    parser.add_argument('--lazyLoad', dest='lazy_load', help='Only index the GEDCOM file up front, then load just the people the search reaches; this is much quicker on large files when few results are wanted.', action='store_true')
+    parser.add_argument('--allConnections', dest='all_connections', help='Draw each result tree by pruning the tree of everyone connected to the root person, rather than from the shortest paths to the results; this shows more of the ways people are related.', action='store_true')
+    parser.add_argument('--kinshipPaths', dest='kinship_paths', help='Draw each result tree with an edge per named relationship (e.g., "Half-brother" or "First cousin once removed") rather than per parent, spouse or child, leaving out people along the way that aren\'t results themselves.', action='store_true')
+    parser.add_argument('--kinshipQuery', dest='kinship_query', help='Rather than search, tell how each of these comma-separated family search IDs is related to the root person (or each of the root persons.)')
+    parser.add_argument('--noCache', dest='no_cache', help='Neither read nor write the binary cache of the family tree data that is normally kept next to the GEDCOM file, and parse the whole GEDCOM file even if only some of it changed.', action='store_true')
 
-        from selenium import webdriver
-        driver = webdriver.Chrome()
+    args = parser.parse_args()
 
-        driver.get('https://www.familysearch.org/en/')
-        element = driver.find_element_by_xpath('//*[@id="signInLink"]')
-        element.click()
+    if args.lazy_load and args.all_connections:
+        raise Exception('Drawing all connections needs the whole family tree, so it cannot be done when loading lazily.')
 
-        element = driver.find_element_by_xpath('//*[@id="userName"]')
-        element.send_keys(args.username)
+    family_tree_data = load_family_tree_data(args)
 
-        element = driver.find_element_by_xpath('//*[@id="password"]')
-        element.send_keys(args.password)
+    if args.lazy_load:
+        print('Found %d people in the family tree; only those the search reaches will be loaded.' % family_tree_data.person_count())
+    else:
+        print('Found %d people in the family tree.' % len(family_tree_data.person_list))
+
+    scrape_cache_file = os.path.join(os.getcwd(), 'scrape_cache.db')
+    scrape_cache = load_scrape_cache(family_tree_data, scrape_cache_file)
+
+    root_id_list = read_root_id_list(args)
+
+    if args.kinship_query is not None:
+        # Ancestor maps are kept from one query to the next, so asking about many pairs of people is cheap.
+        kinship_index = KinshipIndex(family_tree_data)
+        query_person_list = [find_root_person(family_tree_data, family_search_id.strip()) for family_search_id in args.kinship_query.split(',') if len(family_search_id.strip()) > 0]
+        root_person_list = [find_root_person(family_tree_data, root_id) for root_id in root_id_list] if len(root_id_list) > 0 else [find_root_person(family_tree_data, args.root_id)]
+        for root_person in root_person_list:
+            for person in query_person_list:
+                relationship = kinship_index.relate(root_person, person)
+                if relationship is None:
+                    print('"%s" is not related to "%s" by blood, nor by marriage to a blood relative.' % (person.name, root_person.name))
+                else:
+                    step_count, name = relationship
+                    print('"%s" is "%s"\'s %s (%d %s apart, counting generations and marriages.)' % (person.name, root_person.name, name, step_count, 'step' if step_count == 1 else 'steps'))
+        scrape_cache.close()
+        sys.exit(0)
+
+    if len(root_id_list) > 0:
+        if args.web_scrape:
+            raise Exception('Web scraping is not supported with several root persons.')
+        if args.lazy_load:
+            raise Exception('Lazy loading is not supported with several root persons.')
+        for root_id in root_id_list:
+            find_root_person(family_tree_data, root_id)
+        print('Searching from %d root persons...' % len(root_id_list))
+        scrape_cache.close()
+        batch_state['family_tree_data'] = family_tree_data
+        if args.jobs == 1:
+            init_batch_worker(args)
+            for root_id in root_id_list:
+                root_id, out_file = run_batch_search(root_id)
+                print('Finished search from %s; see "%s".' % (root_id, out_file))
+        else:
+            with create_batch_context(args).Pool(processes=args.jobs, initializer=init_batch_worker, initargs=(args,)) as pool:
+                for root_id, out_file in pool.imap_unordered(run_batch_search, root_id_list):
+                    print('Finished search from %s; see "%s".' % (root_id, out_file))
+        sys.exit(0)
+
+    root_person = find_root_person(family_tree_data, args.root_id)
+
+    print('Root person: "%s"' % root_person.name)
+
+    # Text and CSV reports are written out as the search goes, rather than once it's done.
+    result_writer = None
+    if not args.web_scrape:
+        result_writer = create_result_writer(args.out_file)
+        if result_writer is not None:
+            print('Writing report file "%s" as results are found...' % args.out_file)
+
+    try:
+        search_results = search_family_tree(family_tree_data, root_person, args, scrape_cache, result_writer)
+    finally:
+        if result_writer is not None:
+            result_writer.close()
+
+    if args.web_scrape:
+        print('Web scraping search results...')
 
-        element = driver.find_element_by_xpath('//*[@id="login"]')
-        element.click()
+        web_scraper = WebScraper()
+        web_scraper.username = args.username
+        web_scraper.password = args.password
+        if args.scrape_url is not None:
+            web_scraper.ordinances_url = args.scrape_url
+        if args.login_url is not None:
+            web_scraper.login_url = args.login_url
+        if args.scrape_sessions is not None:
+            web_scraper.session_count = args.scrape_sessions
+        if args.scrape_rate is not None:
+            web_scraper.requests_per_second = args.scrape_rate
 
-        search_results.web_scrape(driver, scrape_cache)
-        driver.close()
+        # Each person is committed to the scrape cache as soon as they're scraped, so an interrupted scrape loses nothing.
+        if args.scrape_max_age is not None:
+            search_results.scrape_max_age = args.scrape_max_age * 24 * 60 * 60 if args.scrape_max_age >= 0 else -1
+        if args.stop_after_ready is not None:
+            search_results.scrape_stop_after_ready = args.stop_after_ready
 
-        with open(scrape_cache_file, 'w') as handle:
-            json_text = json.dumps(scrape_cache, indent=4)
-            handle.write(json_text)
+        try:
+            search_results.web_scrape(web_scraper, scrape_cache)
+        finally:
+            web_scraper.close()
+            scrape_cache.close()
 
         print('Wrote scrape cache to file: ' + scrape_cache_file)
     else:
-        print('Generating report file "%s"...' % args.out_file)
-        ext = os.path.splitext(args.out_file)[1]
-        if ext == '.txt':
-            search_results.generate_text_file(args.out_file)
-        elif ext == '.csv':
-            search_results.generate_csv_file(args.out_file)
-        elif ext == '.png':
-            search_results.generate_png_files(args.out_file, root_person, True)
+        scrape_cache.close()
+        if result_writer is not None:
+            print('Wrote %d results to report file: %s' % (result_writer.row_count, args.out_file))
         else:
-            raise Exception('File extension "%s" not supported.' % ext)
\ No newline at end of file
+            generate_report(search_results, args.out_file, root_person, not args.all_connections)
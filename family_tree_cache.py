@@ -0,0 +1,133 @@
+# family_tree_cache.py
+
+import os
+import pickle
+import hashlib
+
+from datetime import datetime
+from family_tree_person import Person, MalePerson, FemalePerson
+from family_tree_graph import FamilyTreeGraph
+
+class FamilyTreeCache(object):
+    # Building the family-tree data from a large GEDCOM file takes a while, so here we save what was built
+    # to a binary file that sits next to the GEDCOM file, and load it back the next time around if the GEDCOM
+    # file hasn't changed.  Persons are stored column-wise, as in the integer graph (see FamilyTreeGraph), along
+    # with the records everything came from, so that if the GEDCOM file has changed, what we load can still serve
+    # as the previous version of the family tree for an incremental re-import (see from_gedcom_record_index.)
+
+    version = 4
+
+    def __init__(self, in_file):
+        self.in_file = in_file
+        self.cache_file = os.path.splitext(in_file)[0] + '.ftcache'
+
+    def calc_content_hash(self):
+        hasher = hashlib.sha1()
+        with open(self.in_file, 'rb') as handle:
+            while True:
+                block = handle.read(1024 * 1024)
+                if len(block) == 0:
+                    break
+                hasher.update(block)
+        return hasher.hexdigest()
+
+    def load(self, family_tree_data, allow_stale=False):
+        # Return true if and only if the given family-tree data was loaded from the cache.  Unless stale data is
+        # allowed, it's only loaded if the GEDCOM file hasn't changed since the cache was saved.  Stale data is only
+        # good as previous data for an incremental re-import, so its persons aren't linked into families.
+        if not os.path.exists(self.cache_file):
+            return False
+        stat = os.stat(self.in_file)
+        with open(self.cache_file, 'rb') as handle:
+            try:
+                header = pickle.load(handle)
+            except Exception:
+                return False
+            if type(header) is not dict or header.get('version') != self.version:
+                return False
+            # The modification time alone is enough to trust the cache, but if the file was merely
+            # touched, we can still use the cache as long as the content hasn't actually changed.
+            fresh = header['size'] == stat.st_size and (header['mtime'] == stat.st_mtime_ns or header['hash'] == self.calc_content_hash())
+            if not fresh and not allow_stale:
+                return False
+            # A truncated or otherwise corrupt body just means the GEDCOM file has to be read again.
+            try:
+                column_map = pickle.load(handle)
+            except Exception:
+                return False
+        self.columns_to_family_tree_data(column_map, family_tree_data, fresh)
+        return True
+
+    def save(self, family_tree_data):
+        if len(family_tree_data.person_record_list) != len(family_tree_data.person_list):
+            raise Exception('Only family-tree data built from a GEDCOM record index can be cached.')
+        stat = os.stat(self.in_file)
+        header = {
+            'version': self.version,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'hash': self.calc_content_hash()
+        }
+        column_map = self.family_tree_data_to_columns(family_tree_data)
+        # Write to the side first so that an interrupted save can't leave a corrupt cache behind.
+        temp_file = self.cache_file + '.tmp'
+        with open(temp_file, 'wb') as handle:
+            pickle.dump(header, handle, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(column_map, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file, self.cache_file)
+
+    def family_tree_data_to_columns(self, family_tree_data):
+        # The integer graph already has everything in columns but the names, IDs and records.
+        column_map = dict(family_tree_data.get_graph().column_map)
+        column_map['name'] = [person.name for person in family_tree_data.person_list]
+        column_map['family_search_id'] = [person.family_search_id for person in family_tree_data.person_list]
+        column_map['person_record_list'] = family_tree_data.person_record_list
+        column_map['family_record_list'] = family_tree_data.family_record_list
+        return column_map
+
+    def columns_to_family_tree_data(self, column_map, family_tree_data, link=True):
+        column_map = dict(column_map)
+        name_list = column_map.pop('name')
+        family_search_id_list = column_map.pop('family_search_id')
+        person_record_list = column_map.pop('person_record_list')
+        family_record_list = column_map.pop('family_record_list')
+        graph = FamilyTreeGraph()
+        graph.from_column_map(column_map)
+
+        person_list = []
+        for i, sex in enumerate(graph.column('sex')):
+            person = MalePerson() if sex == 1 else FemalePerson() if sex == 2 else Person()
+            person.name = name_list[i]
+            person.family_search_id = family_search_id_list[i]
+            for attribute in graph.date_attribute_list:
+                ordinal = graph.column(attribute)[i]
+                if ordinal != 0:
+                    setattr(person, attribute, datetime.fromordinal(ordinal))
+            for attribute in graph.flag_attribute_list:
+                flag = graph.column(attribute)[i]
+                if flag != -1:
+                    setattr(person, attribute, flag == 1)
+            person_list.append(person)
+
+        if link:
+            for i, person in enumerate(person_list):
+                if graph.column('mother')[i] != -1:
+                    person.mother = person_list[graph.column('mother')[i]]
+                if graph.column('father')[i] != -1:
+                    person.father = person_list[graph.column('father')[i]]
+                if hasattr(person, 'spouse_list'):
+                    person.spouse_list = [person_list[j] for j in graph.spouses(i)]
+                if hasattr(person, 'child_list'):
+                    person.child_list = [person_list[j] for j in graph.children(i)]
+        else:
+            # Leave each person as their own record has them, before any family has a say.
+            for person, person_record in zip(person_list, person_record_list):
+                person.sealing_to_spouse_date = None
+                person.born_in_the_covenant = person_record[2]
+
+        # The data was already fixed up before it was cached.
+        family_tree_data.person_record_list = person_record_list
+        family_tree_data.family_record_list = family_record_list
+        family_tree_data.finish_load({person_record[0]: person for person, person_record in zip(person_list, person_record_list)}, post_load_fixup=False)
+        if link:
+            family_tree_data.graph = graph
@@ -2,12 +2,18 @@
 
 from gedcom_exception import GedcomException
 from family_tree_person import MalePerson, FemalePerson, Person
-from datetime import datetime
+from family_tree_graph import FamilyTreeGraph
+from gedcom_date import parse_gedcom_date
 
 class FamilyTreeData(object):
     def __init__(self):
         self.person_list = []
         self.family_search_index = {}
+        self.graph = None
+        self.husband_map = None
+        # When built from a record index, these remember which records everything came from; see from_gedcom_record_index.
+        self.person_record_list = []
+        self.family_record_list = []
 
     def from_gedcom_transmission(self, transmission):
         # Decypher the given GEDCOM transmission in terms of the Lineage-Linked Grammar.
@@ -29,15 +35,144 @@ class FamilyTreeData(object):
         for record in transmission.record_list:
             if record.tag == 'INDI':
                 person = self.generate_gedcom_person(record)
-                person_map[hex(id(record))] = person
+                person_map[id(record)] = person
 
         # Now that all persons are accounted for, make another pass to bind them into family relationships.
         for record in transmission.record_list:
             if record.tag == 'FAM':
                 self.patch_gedcom_person_relationships(record, person_map)
 
+        self.finish_load(person_map)
+
+    def from_gedcom_stream(self, record_iter):
+        # Like from_gedcom_transmission, but the level-0 records are consumed as they are received
+        # (see GedcomTransmission.recv_records), so persons get built while the file is still being read.
+        # Since the records are never patched, cross-references are resolved by xref ID instead.
+
+        person_map = {}
+        family_record_list = []
+        header = None
+        trailer = None
+        for record in record_iter:
+            if header is None:
+                if record.tag != 'HEAD':
+                    raise GedcomException('Did not find header record.')
+                header = record
+            trailer = record
+            if record.tag == 'INDI':
+                person_map[record.xref_id] = self.generate_gedcom_person(record)
+            elif record.tag == 'FAM':
+                # The grammar doesn't promise that a family comes after the individuals it refers to,
+                # so family records are held onto until all persons are accounted for.  They're small.
+                family_record_list.append(record)
+
+        if header is None:
+            raise GedcomException('Cannot create family-tree data from vacuous transmission.')
+
+        if trailer.tag != 'TRLR':
+            raise GedcomException('Did not find trailer record.')
+
+        for record in family_record_list:
+            self.patch_gedcom_person_relationships(record, person_map)
+
+        self.finish_load(person_map)
+
+    def from_gedcom_record_index(self, record_index, previous_family_tree_data=None):
+        # Build the family tree from the records found by the given index (see GedcomRecordIndex.)  If family-tree
+        # data built from an earlier version of the same file is given, only the records whose fingerprints have
+        # changed get parsed; persons and families whose records are the same as before are taken from the earlier
+        # data.  Either way, all the families are linked up again, because that's cheap and because what a person
+        # learns from their families can depend on families whose records didn't change.
+        # Return the list of xref IDs of the individual and family records that were parsed.
+        #
+        # Besides the persons, we remember (key, fingerprint, born-in-the-covenant) of each person's record, the last
+        # being what the record says before any family has a say, and (key, fingerprint, husband key, wife key, child
+        # key list, sealing-to-spouse date) of each family, where a key is the xref ID of a record.
+
+        entry_list = record_index.entry_list
+        if len(entry_list) == 0:
+            raise GedcomException('Cannot create family-tree data from vacuous transmission.')
+
+        if entry_list[0].tag != 'HEAD':
+            raise GedcomException('Did not find header record.')
+
+        if entry_list[-1].tag != 'TRLR':
+            raise GedcomException('Did not find trailer record.')
+
+        previous_person_record_map = {}
+        previous_family_record_map = {}
+        if previous_family_tree_data is not None:
+            for person, person_record in zip(previous_family_tree_data.person_list, previous_family_tree_data.person_record_list):
+                previous_person_record_map[person_record[0]] = (person, person_record)
+            for family_record in previous_family_tree_data.family_record_list:
+                previous_family_record_map[family_record[0]] = family_record
+
+        entry_key = record_index.entry_key
+
+        parse_entry_list = []
+        for entry in entry_list:
+            if entry.tag == 'INDI':
+                previous = previous_person_record_map.get(entry_key(entry))
+                if previous is None or previous[1][1] != entry.fingerprint:
+                    parse_entry_list.append(entry)
+            elif entry.tag == 'FAM':
+                previous = previous_family_record_map.get(entry_key(entry))
+                if previous is None or previous[1] != entry.fingerprint:
+                    parse_entry_list.append(entry)
+
+        # The records to parse are read in step with the entries, so that we never hold more than one at a time.
+        parse_entry_set = {id(entry) for entry in parse_entry_list}
+        record_iter = record_index.read_records(parse_entry_list)
+        person_map = {}
+        self.person_record_list = []
+        self.family_record_list = []
+        for entry in entry_list:
+            key = entry_key(entry)
+            if entry.tag == 'INDI':
+                if id(entry) in parse_entry_set:
+                    person = self.generate_gedcom_person(next(record_iter))
+                    born_in_the_covenant = person.born_in_the_covenant
+                else:
+                    person, person_record = previous_person_record_map[key]
+                    born_in_the_covenant = person_record[2]
+                    person.reset_family_links()
+                    person.born_in_the_covenant = born_in_the_covenant
+                person_map[key] = person
+                self.person_record_list.append((key, entry.fingerprint, born_in_the_covenant))
+            elif entry.tag == 'FAM':
+                if id(entry) in parse_entry_set:
+                    family_record = (key, entry.fingerprint) + self.generate_gedcom_family(next(record_iter))
+                else:
+                    family_record = previous_family_record_map[key]
+                self.family_record_list.append(family_record)
+
+        self.link_family_records(person_map)
+        self.finish_load(person_map)
+        return [entry_key(entry) for entry in parse_entry_list]
+
+    def link_family_records(self, person_map):
+        # Link up persons, keyed by xref ID in the given map, into the families of our family record list.
+        def lookup_person(key):
+            if key is None:
+                return None
+            if key not in person_map:
+                raise GedcomException('Family refers to unknown individual "%s".' % key)
+            return person_map[key]
+
+        for key, fingerprint, husband_key, wife_key, child_key_list, sealing_to_spouse_date in self.family_record_list:
+            husband = lookup_person(husband_key)
+            wife = lookup_person(wife_key)
+            self.link_family(husband, wife, [lookup_person(child_key) for child_key in child_key_list], sealing_to_spouse_date)
+
+    def finish_load(self, person_map, post_load_fixup=True):
         self.person_list = [person_map[key] for key in person_map]
 
+        # Each person's index into our list doubles as its node in the integer graph.
+        for i, person in enumerate(self.person_list):
+            person.index = i
+        self.graph = None
+        self.husband_map = None
+
         # Build an index by family search's family tree ID.
         self.family_search_index = {}
         for person in self.person_list:
@@ -45,33 +180,54 @@ class FamilyTreeData(object):
                 self.family_search_index[person.family_search_id] = person
 
         # Lastly, do any needed post-load processing.
-        for person in self.person_list:
-            person.post_load_fixup()
+        if post_load_fixup:
+            for person in self.person_list:
+                person.post_load_fixup()
+
+    def find_person(self, family_search_id):
+        # Return the person with the given family search ID, or None if there isn't one.
+        return self.family_search_index.get(family_search_id)
+
+    def first_person(self):
+        return self.person_list[0]
+
+    def load_person(self, person):
+        # Everything is already loaded here; see LazyFamilyTreeData.
+        pass
+
+    def find_spouses(self, person):
+        # Only a man has a list of spouses, so a woman's husbands are found by looking through everyone's lists,
+        # which is done once, the first time it's needed.
+        if hasattr(person, 'spouse_list'):
+            return list(person.spouse_list)
+        if self.husband_map is None:
+            self.husband_map = {}
+            for husband in self.person_list:
+                for wife in getattr(husband, 'spouse_list', []):
+                    husband_list = self.husband_map.setdefault(wife, [])
+                    if husband not in husband_list:
+                        husband_list.append(husband)
+        return list(self.husband_map.get(person, []))
+
+    def get_graph(self):
+        # The integer-indexed graph is only built if somebody asks for it.
+        if self.graph is None:
+            self.graph = FamilyTreeGraph()
+            self.graph.from_person_list(self.person_list)
+        return self.graph
 
     def to_gedcom_transmission(self):
         raise GedcomException('Not yet implimented.')
 
     def generate_datetime(self, date_line):
-        if date_line is not None:
-            date_text = ' '.join(date_line.value)
-            date_format_list = [
-                '%Y',
-                'ABT %Y',
-                '%B %Y',
-                '%b %Y',
-                '%d %B %Y',
-                '%d %b %Y'
-            ]
-            for date_format in date_format_list:
-                try:
-                    date_obj = datetime.strptime(date_text, date_format)
-                    return date_obj
-                except ValueError as ve:
-                    pass
+        if date_line is not None and date_line.value is not None:
+            date = parse_gedcom_date(' '.join(date_line.value))
+            if date is not None:
+                return date.to_datetime()
         return None
 
     def generate_gedcom_person(self, record):
-        sex_line = record.find_sub_line('SEX')
+        sex_line = record.find_child_line('SEX')
         if sex_line is None:
             person = Person()
         elif sex_line.value[0] == 'M':
@@ -81,85 +237,262 @@ class FamilyTreeData(object):
         else:
             raise GedcomException('SEX field of person was neither "M" nor "F".')
 
-        family_search_id_line = record.find_sub_line('_FSFTID')
+        family_search_id_line = record.find_child_line('_FSFTID')
         if family_search_id_line is not None:
             person.family_search_id = family_search_id_line.value[0]
 
-        name_line = record.find_sub_line('NAME')
+        name_line = record.find_child_line('NAME')
         if name_line is None:
             raise GedcomException('Failed to find NAME field in person record.')
 
         person.name = ' '.join(name_line.value).replace('/', '')
 
-        birth_line = record.find_sub_line('BIRT')
+        birth_line = record.find_child_line('BIRT')
         if birth_line is not None:
-            person.birthday = self.generate_datetime(birth_line.find_sub_line('DATE'))
+            person.birthday = self.generate_datetime(birth_line.find_child_line('DATE'))
 
-        death_line = record.find_sub_line('DEAT')
+        death_line = record.find_child_line('DEAT')
         if death_line is not None:
-            person.deathday = self.generate_datetime(death_line.find_sub_line('DATE'))
+            person.deathday = self.generate_datetime(death_line.find_child_line('DATE'))
 
-        christening_line = record.find_sub_line('CHR')
+        christening_line = record.find_child_line('CHR')
         if christening_line is not None:
-            person.christening_date = self.generate_datetime(christening_line.find_sub_line('DATE'))
+            person.christening_date = self.generate_datetime(christening_line.find_child_line('DATE'))
 
         life_span = person.calc_life_span()
         if life_span is not None:
             person.died_before_eight = life_span.days < 365 * 8
 
         # Note that this is not needed if the child died before reaching the age of accountability.
-        baptism_line = record.find_sub_line('BAPL')
+        baptism_line = record.find_child_line('BAPL')
         if baptism_line is not None:
-            person.baptism_date = self.generate_datetime(baptism_line.find_sub_line('DATE'))
-            status_line = baptism_line.find_sub_line('STAT')
+            person.baptism_date = self.generate_datetime(baptism_line.find_child_line('DATE'))
+            status_line = baptism_line.find_child_line('STAT')
             if status_line is not None:
                 if status_line.value[0] == 'CHILD' or status_line.value[0] == 'STILLBORN':
                     person.died_before_eight = True
 
-        endownment_line = record.find_sub_line('ENDL')
+        endownment_line = record.find_child_line('ENDL')
         if endownment_line is not None:
-            person.endownment_date = self.generate_datetime(endownment_line.find_sub_line('DATE'))
+            person.endownment_date = self.generate_datetime(endownment_line.find_child_line('DATE'))
 
         # Note that this is not needed if the child is born in the covenant.
-        sealing_to_parents_line = record.find_sub_line('SLGC')
+        sealing_to_parents_line = record.find_child_line('SLGC')
         if sealing_to_parents_line is not None:
-            person.sealing_to_parents_date = self.generate_datetime(sealing_to_parents_line.find_sub_line('DATE'))
-            status_line = sealing_to_parents_line.find_sub_line('STAT')
+            person.sealing_to_parents_date = self.generate_datetime(sealing_to_parents_line.find_child_line('DATE'))
+            status_line = sealing_to_parents_line.find_child_line('STAT')
             if status_line is not None:
                 if status_line.value[0] == 'BIC':
                     person.born_in_the_covenant = True
 
         return person
 
+    def lookup_gedcom_person(self, pointer_line, person_map):
+        # A patched line points right at the individual's record, whereas
+        # a streamed line still holds the xref ID of that record as its value.
+        if pointer_line.pointer is not None:
+            key = id(pointer_line.pointer)
+        else:
+            key = pointer_line.value[0]
+        if key not in person_map:
+            raise GedcomException('Family refers to unknown individual "%s".' % ' '.join(pointer_line.value))
+        return person_map[key]
+
+    def generate_gedcom_family(self, record):
+        # Boil an unpatched family record down to (husband xref ID, wife xref ID, child xref ID list, sealing-to-spouse date.)
+        husband_line = record.find_child_line('HUSB')
+        wife_line = record.find_child_line('WIFE')
+        sealing_to_spouse_date = None
+        sealing_to_spouse_line = record.find_child_line('SLGS')
+        if sealing_to_spouse_line is not None:
+            sealing_to_spouse_date = self.generate_datetime(sealing_to_spouse_line.find_child_line('DATE'))
+        return (
+            husband_line.value[0] if husband_line is not None else None,
+            wife_line.value[0] if wife_line is not None else None,
+            [child_line.value[0] for child_line in record.find_all_child_lines('CHIL')],
+            sealing_to_spouse_date
+        )
+
     def patch_gedcom_person_relationships(self, family_record, person_map):
-        husband_record = family_record.find_sub_line('HUSB')
-        wife_record = family_record.find_sub_line('WIFE')
+        husband_record = family_record.find_child_line('HUSB')
+        wife_record = family_record.find_child_line('WIFE')
 
+        husband = None
         if husband_record is not None:
-            husband = person_map[hex(id(husband_record.pointer))]
+            husband = self.lookup_gedcom_person(husband_record, person_map)
 
+        wife = None
         if wife_record is not None:
-            wife = person_map[hex(id(wife_record.pointer))]
+            wife = self.lookup_gedcom_person(wife_record, person_map)
+
+        child_list = [self.lookup_gedcom_person(child_record, person_map) for child_record in family_record.find_all_child_lines('CHIL')]
+
+        sealing_to_spouse_date = None
+        sealing_to_spouse_line = family_record.find_child_line('SLGS')
+        if sealing_to_spouse_line is not None:
+            sealing_to_spouse_date = self.generate_datetime(sealing_to_spouse_line.find_child_line('DATE'))
+
+        self.link_family(husband, wife, child_list, sealing_to_spouse_date)
 
-        if husband_record is not None and wife_record is not None:
+    def link_family(self, husband, wife, child_list, sealing_to_spouse_date):
+        if husband is not None and wife is not None:
             husband.spouse_list.append(wife)
 
-        for child_record in family_record.for_all_sub_lines('CHIL'):
-            child = person_map[hex(id(child_record.pointer))]
-            if wife_record is not None:
+        for child in child_list:
+            if wife is not None:
                 wife.child_list.append(child)
                 child.mother = wife
-            if husband_record is not None:
+            if husband is not None:
                 child.father = husband
 
-        sealing_to_spouse_line = family_record.find_sub_line('SLGS')
-        if sealing_to_spouse_line is not None:
-            sealing_to_spouse_date = self.generate_datetime(sealing_to_spouse_line.find_sub_line('DATE'))
+        if sealing_to_spouse_date is not None:
+            if husband is not None:
+                husband.sealing_to_spouse_date = sealing_to_spouse_date
+            if wife is not None:
+                wife.sealing_to_spouse_date = sealing_to_spouse_date
+                for child in wife.child_list:
+                    if child.birthday is not None:
+                        child.born_in_the_covenant = True if child.birthday > sealing_to_spouse_date else False
+
+class LazyFamilyTreeData(FamilyTreeData):
+    # Family-tree data that only loads persons as they're asked for, so that a search around one root person
+    # costs about as much as the neighborhood it covers, rather than the whole file.  Persons are parsed from the
+    # records found by a GedcomRecordIndex when first referred to, but only get their family links once they're
+    # passed to load_person, as a walker does just before visiting someone (see FamilyTreeWalker.load_func.)
+    # Until then, a person has no mother, father, spouses or children.
+    #
+    # Since linking someone takes the whole index into account, a person is linked just as they would be if the
+    # whole file were loaded, and never needs to be linked again.  The integer graph isn't available here.
+
+    def __init__(self, record_index):
+        super().__init__()
+        entry_list = record_index.entry_list
+        if len(entry_list) == 0:
+            raise GedcomException('Cannot create family-tree data from vacuous transmission.')
+
+        if entry_list[0].tag != 'HEAD':
+            raise GedcomException('Did not find header record.')
+
+        if entry_list[-1].tag != 'TRLR':
+            raise GedcomException('Did not find trailer record.')
+
+        self.record_index = record_index
+        self.person_map = {}            # Individual record key to person, for everyone parsed so far.
+        self.person_key_list = []       # Individual record key of each person, by index.
+        self.family_map = {}            # Family record key to (husband key, wife key, child key list, sealing-to-spouse date.)
+        self.linked_set = set()         # Indices of persons whose family links are complete.
+
+    def person_count(self):
+        return len([entry for entry in self.record_index.entry_list if entry.tag == 'INDI'])
+
+    def find_person(self, family_search_id):
+        key = self.record_index.family_search_id_map.get(family_search_id)
+        if key is None:
+            return None
+        return self.lookup_persons([key])[0]
+
+    def first_person(self):
+        for entry in self.record_index.entry_list:
+            if entry.tag == 'INDI':
+                return self.lookup_persons([self.record_index.entry_key(entry)])[0]
+        raise GedcomException('Did not find any individual records.')
+
+    def get_graph(self):
+        raise Exception('The integer graph is not available when loading lazily.')
+
+    def find_spouses(self, person):
+        self.load_person(person)
+        if hasattr(person, 'spouse_list'):
+            return list(person.spouse_list)
+        key = self.person_key_list[person.index]
+        husband_key_list = []
+        for family_key in self.record_index.person_family_map.get(key, []):
+            husband_key, wife_key, child_key_list = self.record_index.family_member_map[family_key]
+            if wife_key == key and husband_key is not None and husband_key not in husband_key_list:
+                husband_key_list.append(husband_key)
+        return self.lookup_persons(husband_key_list)
+
+    def lookup_persons(self, key_list):
+        # Return the persons of the given individual record keys, parsing any we haven't already.
+        parse_key_list = sorted({key for key in key_list if key not in self.person_map}, key=lambda key: self.lookup_entry(key, 'INDI').offset)
+        record_iter = self.record_index.read_records([self.record_index.entry_map[key] for key in parse_key_list])
+        for key, record in zip(parse_key_list, record_iter):
+            person = self.generate_gedcom_person(record)
+            person.index = len(self.person_list)
+            self.person_list.append(person)
+            self.person_key_list.append(key)
+            self.person_map[key] = person
+            if person.family_search_id is not None and self.record_index.family_search_id_map.get(person.family_search_id) == key:
+                self.family_search_index[person.family_search_id] = person
+        return [self.person_map[key] for key in key_list]
+
+    def lookup_entry(self, key, tag):
+        entry = self.record_index.entry_map.get(key)
+        if entry is None or entry.tag != tag:
+            raise GedcomException('Family refers to unknown individual "%s".' % key if tag == 'INDI' else 'Unknown family "%s".' % key)
+        return entry
+
+    def lookup_families(self, family_key_list):
+        # Return the family records of the given keys, in file order, parsing any we haven't already.
+        family_key_list = sorted(set(family_key_list), key=lambda key: self.lookup_entry(key, 'FAM').offset)
+        parse_key_list = [key for key in family_key_list if key not in self.family_map]
+        record_iter = self.record_index.read_records([self.record_index.entry_map[key] for key in parse_key_list])
+        for key, record in zip(parse_key_list, record_iter):
+            self.family_map[key] = self.generate_gedcom_family(record)
+        return [(key,) + self.family_map[key] for key in family_key_list]
+
+    def load_person(self, person):
+        # Link the given person into their families, along with whoever else is needed to tell what ordinances
+        # they need: a man only counts as having had children if they're his wives' children who name him as father.
+        self.link_person(person)
+        if hasattr(person, 'spouse_list'):
+            for spouse in person.spouse_list:
+                self.link_person(spouse)
+                for child in spouse.child_list:
+                    self.link_person(child)
+
+    def link_person(self, person):
+        # This does for one person what link_family_records does for everyone, going through the same families in
+        # the same order, so the outcome is the same.  A child's birth in the covenant depends on the sealings of
+        # every family of their mother, not just the one they were born into.
+        if person.index in self.linked_set:
+            return
+        key = self.person_key_list[person.index]
+        person_family_map = self.record_index.person_family_map
+        family_member_map = self.record_index.family_member_map
+
+        family_key_list = person_family_map.get(key, [])
+        mother_family_key_list = []
+        for family_key in family_key_list:
+            husband_key, wife_key, child_key_list = family_member_map[family_key]
+            if wife_key is not None and key in child_key_list:
+                mother_family_key_list += person_family_map.get(wife_key, [])
+
+        member_key_list = []
+        for family_key in family_key_list:
+            husband_key, wife_key, child_key_list = family_member_map[family_key]
+            member_key_list += [member_key for member_key in [husband_key, wife_key] + child_key_list if member_key is not None]
+        self.lookup_persons(member_key_list)
+
+        family_key_set = set(family_key_list)
+        mother_key_set = set()
+        for family_key, husband_key, wife_key, child_key_list, sealing_to_spouse_date in self.lookup_families(family_key_list + mother_family_key_list):
+            if family_key in family_key_set:
+                if key == husband_key and wife_key is not None:
+                    person.spouse_list.append(self.person_map[wife_key])
+                for child_key in child_key_list:
+                    if key == wife_key:
+                        person.child_list.append(self.person_map[child_key])
+                    if key == child_key:
+                        if wife_key is not None:
+                            person.mother = self.person_map[wife_key]
+                            mother_key_set.add(wife_key)
+                        if husband_key is not None:
+                            person.father = self.person_map[husband_key]
             if sealing_to_spouse_date is not None:
-                if husband is not None:
-                    husband.sealing_to_spouse_date = sealing_to_spouse_date
-                if wife is not None:
-                    wife.sealing_to_spouse_date = sealing_to_spouse_date
-                    for child in wife.child_list:
-                        if child.birthday is not None:
-                            child.born_in_the_covenant = True if child.birthday > sealing_to_spouse_date else False
\ No newline at end of file
+                if key == husband_key or key == wife_key:
+                    person.sealing_to_spouse_date = sealing_to_spouse_date
+                if wife_key in mother_key_set and person.birthday is not None:
+                    person.born_in_the_covenant = True if person.birthday > sealing_to_spouse_date else False
+
+        self.linked_set.add(person.index)
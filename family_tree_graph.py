@@ -0,0 +1,135 @@
+# family_tree_graph.py
+
+import operator
+
+from array import array
+from itertools import chain, repeat
+from family_tree_person import MalePerson, FemalePerson
+
+class FamilyTreeGraph(object):
+    # A dense, integer-indexed view of the family tree.  Person i of the family-tree data's person list is
+    # node i here.  Parent, spouse and child edges are kept in CSR form: the neighbors of node i are found
+    # in the index column between offset[i] and offset[i + 1].  Every date and ordinance field of the
+    # persons is also kept as a column, so that whole-population questions can be asked of plain arrays.
+
+    date_attribute_list = [
+        'birthday',
+        'deathday',
+        'christening_date',
+        'baptism_date',
+        'endownment_date',
+        'sealing_to_spouse_date',
+        'sealing_to_parents_date'
+    ]
+
+    flag_attribute_list = [
+        'born_in_the_covenant',
+        'died_before_eight'
+    ]
+
+    edge_attribute_list = [
+        'parent',
+        'spouse',
+        'child'
+    ]
+
+    def __init__(self):
+        self.size = 0
+        self.column_map = {}
+        self.cached_had_any_children_mask = None
+
+    def from_person_list(self, person_list):
+        self.size = len(person_list)
+        self.cached_had_any_children_mask = None
+        self.column_map = {
+            # Sex is 1 for male, 2 for female and 0 for unknown.
+            'sex': array('b', [1 if isinstance(person, MalePerson) else 2 if isinstance(person, FemalePerson) else 0 for person in person_list]),
+            'mother': array('l', [person.mother.index if person.mother is not None else -1 for person in person_list]),
+            'father': array('l', [person.father.index if person.father is not None else -1 for person in person_list])
+        }
+
+        # Dates are stored as proleptic Gregorian ordinals, with zero meaning no date.
+        for attribute in self.date_attribute_list:
+            self.column_map[attribute] = array('l', [getattr(person, attribute).toordinal() if getattr(person, attribute) is not None else 0 for person in person_list])
+
+        # Flags may be true (1), false (0) or unknown (-1).
+        for attribute in self.flag_attribute_list:
+            self.column_map[attribute] = array('b', [-1 if getattr(person, attribute) is None else int(getattr(person, attribute)) for person in person_list])
+
+        for attribute in self.edge_attribute_list:
+            offset_column = array('l', [0])
+            index_column = array('l')
+            for person in person_list:
+                if attribute == 'parent':
+                    index_column.extend([parent.index for parent in [person.mother, person.father] if parent is not None])
+                elif hasattr(person, attribute + '_list'):
+                    index_column.extend([other_person.index for other_person in getattr(person, attribute + '_list')])
+                offset_column.append(len(index_column))
+            self.column_map[attribute + '_offset'] = offset_column
+            self.column_map[attribute + '_index'] = index_column
+
+    def from_column_map(self, column_map):
+        self.size = len(column_map['sex'])
+        self.column_map = column_map
+        self.cached_had_any_children_mask = None
+
+    def column(self, name):
+        return self.column_map[name]
+
+    def neighbors(self, i, edge_attribute):
+        offset_column = self.column_map[edge_attribute + '_offset']
+        return self.column_map[edge_attribute + '_index'][offset_column[i]:offset_column[i + 1]]
+
+    def parents(self, i):
+        return self.neighbors(i, 'parent')
+
+    def spouses(self, i):
+        return self.neighbors(i, 'spouse')
+
+    def children(self, i):
+        return self.neighbors(i, 'child')
+
+    # Person masks are Python integers in which byte i is one if person i is in the mask and zero otherwise.
+    # Combining masks with &, | and ^ then works over the whole population at once at the speed of C.
+
+    def mask_from_bytes(self, byte_list):
+        return int.from_bytes(bytes(byte_list), 'little')
+
+    def mask_to_bytes(self, mask):
+        # Convert to something that can be indexed by person in constant time.
+        return mask.to_bytes(self.size, 'little')
+
+    def full_mask(self):
+        return int.from_bytes(b'\x01' * self.size, 'little')
+
+    def invert_mask(self, mask):
+        return mask ^ self.full_mask()
+
+    def date_known_mask(self, attribute):
+        return self.mask_from_bytes(map(bool, self.column_map[attribute]))
+
+    def flag_set_mask(self, attribute):
+        return self.mask_from_bytes(map((1).__eq__, self.column_map[attribute]))
+
+    def had_any_children_mask(self):
+        # This agrees with the had_any_children method of the person classes.  A woman had children if her
+        # child list isn't empty.  A man had children if one of his wives is the mother of a child naming him
+        # as father.  (A child always has its mother in common with the child list it appears in.)
+        # The relationships never change, so this is only worked out once.
+        if self.cached_had_any_children_mask is not None:
+            return self.cached_had_any_children_mask
+        child_offset_column = self.column_map['child_offset']
+        byte_list = bytearray(map(operator.lt, child_offset_column[:-1], child_offset_column[1:]))
+        spouse_offset_column = self.column_map['spouse_offset']
+        spouse_count_list = map(operator.sub, spouse_offset_column[1:], spouse_offset_column[:-1])
+        couple_set = set(zip(chain.from_iterable(map(repeat, range(self.size), spouse_count_list)), self.column_map['spouse_index']))
+        for i, k in couple_set.intersection(zip(self.column_map['father'], self.column_map['mother'])):
+            byte_list[i] = 1
+        self.cached_had_any_children_mask = self.mask_from_bytes(byte_list)
+        return self.cached_had_any_children_mask
+
+    def life_span_under_mask(self, days):
+        # This agrees with the calc_life_span method of the person classes.
+        return self.mask_from_bytes(
+            death != 0 and (birth != 0 or christening != 0) and death - (birth if birth != 0 else christening) < days
+            for death, birth, christening in zip(self.column_map['deathday'], self.column_map['birthday'], self.column_map['christening_date']))
@@ -1,7 +1,5 @@
 # family_tree_person.py
 
-import time
-
 from render_tree import RenderNode
 
 class Person(object):
@@ -25,19 +23,49 @@ class Person(object):
         self.died_before_eight = None
         self.family_search_id = None
         self.any_proxy_work_available = False
+        self.index = None   # See FamilyTreeData.finish_load.
 
     def generate_render_tree(self, visitation_set):
-        visitation_set.add(hex(id(self)))
-        render_node = RenderNode(person=self)
-        if self.mother and not hex(id(self.mother)) in visitation_set:
-            render_node.sub_node_map['mother'] = self.mother.generate_render_tree(visitation_set)
-        if self.father and not hex(id(self.father)) in visitation_set:
-            render_node.sub_node_map['father'] = self.father.generate_render_tree(visitation_set)
-        return render_node
+        # Build the tree of everyone connected to this person, depth-first, each person being put wherever they're
+        # first reached.  This goes through relatives in the same order a recursion would, but keeps its own stack,
+        # so that a tree of any depth can be built.  A stack entry holds a node, the rest of its relatives still to
+        # go through, and how many spouses and children it has been given so far, for numbering them.
+        visitation_set.add(self.index)
+        root_node = RenderNode(person=self)
+        stack = [(root_node, self.generate_render_tree_relatives(), {'spouse': 0, 'child': 0})]
+        while len(stack) > 0:
+            render_node, relative_iter, count_map = stack[-1]
+            for edge, person in relative_iter:
+                if person.index not in visitation_set:
+                    visitation_set.add(person.index)
+                    sub_node = RenderNode(person=person)
+                    if edge in count_map:
+                        count_map[edge] += 1
+                        render_node.sub_node_map['%s_%d' % (edge, count_map[edge])] = sub_node
+                    else:
+                        render_node.sub_node_map[edge] = sub_node
+                    stack.append((sub_node, person.generate_render_tree_relatives(), {'spouse': 0, 'child': 0}))
+                    break
+            else:
+                stack.pop()
+        return root_node
+
+    def generate_render_tree_relatives(self):
+        # Yield (edge, person) for each relative to branch out to from this person in the render tree.
+        if self.mother:
+            yield 'mother', self.mother
+        if self.father:
+            yield 'father', self.father
 
     def post_load_fixup(self):
         pass
 
+    def reset_family_links(self):
+        # Forget everything learned about this person from family records, so that the families can be linked again.
+        self.mother = None
+        self.father = None
+        self.sealing_to_spouse_date = None
+
     def calc_life_span(self):
         life_span = None
         if self.deathday is not None:
@@ -51,55 +79,27 @@ class Person(object):
         return False
 
     def consume_scrape_cache(self, scrape_cache):
-        if self.family_search_id in scrape_cache:
-            info = scrape_cache[self.family_search_id]
+        info = scrape_cache.get(self.family_search_id)
+        if info is not None:
             for ordinance in info:
                 status = info[ordinance]
                 if status == 'Ready':
                     self.any_proxy_work_available = True
                     break
 
-    def web_scrape(self, driver, scrape_cache):
-        # This is a bit insane and I'm not sure how ethical it is to thrash the website either.
-        # I'm not scraping every person in my family tree; just those in my search results.
-        # I want to know if ordinance work is already in progress or if it can be reserved.
-
-        info = scrape_cache[self.family_search_id] if self.family_search_id in scrape_cache else {}
-
-        url = 'https://www.familysearch.org/tree/person/ordinances/%s' % self.family_search_id
-        driver.get(url)
-        time.sleep(2)
-
-        shadow_element = driver.execute_script('return document.querySelector("#main-content-section > fs-person-page").shadowRoot')
-        shadow_element = driver.execute_script('return arguments[0].querySelector("#pages > fs-tree-person-ordinance-list").shadowRoot', shadow_element)
-        shadow_element = driver.execute_script('return arguments[0].querySelector("fs-tree-person-ordinances").shadowRoot', shadow_element)
-        row_element_list = shadow_element.find_elements_by_class_name('ordinance-table-row')
-
-        for row_element in row_element_list:
-            element = driver.execute_script('return arguments[0].querySelector("fs-tree-person-ordinance").shadowRoot', row_element)
-            element = element.find_element_by_class_name('ordLabelText')
-            text = element.text
-            text_list = text.split('\n')
-            if len(text_list) == 2:
-                ordinance = text_list[0]
-                status = text_list[1]
-                info[ordinance] = status
-
-        scrape_cache[self.family_search_id] = info
-
 class MalePerson(Person):
     def __init__(self):
         super().__init__()
         self.spouse_list = []
 
-    def generate_render_tree(self, visitation_set):
-        render_node = super().generate_render_tree(visitation_set)
-        i = 1
+    def reset_family_links(self):
+        super().reset_family_links()
+        self.spouse_list = []
+
+    def generate_render_tree_relatives(self):
+        yield from super().generate_render_tree_relatives()
         for spouse in self.spouse_list:
-            if hex(id(spouse)) not in visitation_set:
-                render_node.sub_node_map['spouse_%d' % i] = spouse.generate_render_tree(visitation_set)
-                i += 1
-        return render_node
+            yield 'spouse', spouse
 
     def had_any_children(self):
         for spouse in self.spouse_list:
@@ -113,14 +113,14 @@ class FemalePerson(Person):
         super().__init__()
         self.child_list = []
 
-    def generate_render_tree(self, visitation_set):
-        render_node = super().generate_render_tree(visitation_set)
-        i = 1
+    def reset_family_links(self):
+        super().reset_family_links()
+        self.child_list = []
+
+    def generate_render_tree_relatives(self):
+        yield from super().generate_render_tree_relatives()
         for child in self.child_list:
-            if hex(id(child)) not in visitation_set:
-                render_node.sub_node_map['child_%d' % i] = child.generate_render_tree(visitation_set)
-                i += 1
-        return render_node
+            yield 'child', child
 
     def post_load_fixup(self):
         if any([child.mother != self for child in self.child_list]):
@@ -1,18 +1,53 @@
 # family_tree_walker.py
 
+import heapq
+
+from collections import deque
 from family_tree_person import MalePerson, FemalePerson
+from kinship import describe_relationship
 
 class Relationship(object):
-    def __init__(self, person, path):
+    # A relationship doesn't carry its own copy of the path from the root person.  It only knows the relationship
+    # it was reached from and the kind of edge (with an index for spouses and children) that was taken from there,
+    # so that reaching someone costs the same however deep they are.  The path is only put together when asked for.
+
+    __slots__ = ('person', 'predecessor', 'edge', 'edge_index', 'length', 'spouse_crossed', 'cached_path')
+
+    def __init__(self, person, predecessor=None, edge=None, edge_index=-1):
         self.person = person
-        self.path = path
+        self.predecessor = predecessor
+        self.edge = edge
+        self.edge_index = edge_index
+        if predecessor is None:
+            self.length = 0
+            self.spouse_crossed = False
+        else:
+            self.length = predecessor.length + 1
+            self.spouse_crossed = predecessor.spouse_crossed or edge == 'spouse'
+        self.cached_path = None
 
     def __str__(self):
-        # TODO: Convert path into human-readable sentence.
-        return ''
+        # E.g., "father's first cousin once removed"; see kinship.py.
+        relationship = self
+        while relationship.predecessor is not None:
+            relationship = relationship.predecessor
+        return describe_relationship(relationship.person, self.path)
+
+    @property
+    def path(self):
+        # The list of (edge, index) components leading from the root person to this one.
+        if self.cached_path is None:
+            path = []
+            relationship = self
+            while relationship.predecessor is not None:
+                path.append((relationship.edge, relationship.edge_index))
+                relationship = relationship.predecessor
+            path.reverse()
+            self.cached_path = path
+        return self.cached_path
 
     def spouse_in_path(self):
-        return any(['spouse' == component[0] for component in self.path])
+        return self.spouse_crossed
 
 class FamilyTreeWalker(object):
     def __init__(self, root_person):
@@ -22,33 +57,73 @@ class FamilyTreeWalker(object):
         self.max_relationship_path_length = -1
         self.avoid_inlaws = True
         self.avoid_spouses = False
+        self.edge_cost_map = None   # E.g., {'spouse': 3.0}; if given, the walk is weighted.  Unlisted edges cost one.
+        self.load_func = None       # If given, this is called with each person just before they're visited and expanded.
 
     def walk(self):
+        # People are visited in order of their distance from the root person, so that the
+        # closest relatives are always the ones found first, and every path is a shortest one.
+        if self.edge_cost_map is None:
+            self.walk_breadth_first()
+        else:
+            self.walk_weighted()
+
+    def walk_breadth_first(self):
+        # A person is marked as visited when they are queued, so that nobody is ever queued twice.
+        visitation_set = {self.root_person}
+        queue = deque([Relationship(self.root_person)])
+        while len(queue) > 0:
+            relationship = queue.popleft()
+            keep_going = self.visit(relationship)
+            if not keep_going:
+                break
+            for person, edge, edge_index in self.expand(relationship):
+                if person not in visitation_set:
+                    visitation_set.add(person)
+                    queue.append(Relationship(person, relationship, edge, edge_index))
+
+    def walk_weighted(self):
+        # This is Dijkstra's algorithm.  Here a person can be queued more than once, if a cheaper way to
+        # reach them turns up, but they're only visited once, by way of the cheapest path.
         visitation_set = set()
-        relationship = Relationship(self.root_person, [])
-        queue = [relationship]
+        cost_map = {self.root_person: 0.0}
+        queue = [(0.0, 0, Relationship(self.root_person))]
+        count = 1   # This breaks ties in favor of whoever was queued first.
         while len(queue) > 0:
-            relationship = queue.pop()
+            cost, _, relationship = heapq.heappop(queue)
+            if relationship.person in visitation_set:
+                continue
+            visitation_set.add(relationship.person)
             keep_going = self.visit(relationship)
             if not keep_going:
                 break
-            person = relationship.person
-            visitation_set.add(person)
-            if self.max_relationship_path_length == -1 or len(relationship.path) < self.max_relationship_path_length:
-                if not self.avoid_inlaws or not relationship.spouse_in_path():
-                    if person.mother is not None and person.mother not in visitation_set:
-                        queue.append(Relationship(person.mother, relationship.path + [('mother', -1)]))
-                    if person.father is not None and person.father not in visitation_set:
-                        queue.append(Relationship(person.father, relationship.path + [('father', -1)]))
-                if hasattr(person, 'spouse_list') and not self.avoid_spouses:
-                    for i, spouse in enumerate(person.spouse_list):
-                        if spouse not in visitation_set:
-                            queue.append(Relationship(spouse, relationship.path + [('spouse', i)]))
-                if hasattr(person, 'child_list'):
-                    for i, child in enumerate(person.child_list):
-                        if child not in visitation_set:
-                            queue.append(Relationship(child, relationship.path + [('child', i)]))
+            for person, edge, edge_index in self.expand(relationship):
+                if person not in visitation_set:
+                    next_cost = cost + self.edge_cost_map.get(edge, 1.0)
+                    if person not in cost_map or next_cost < cost_map[person]:
+                        cost_map[person] = next_cost
+                        heapq.heappush(queue, (next_cost, count, Relationship(person, relationship, edge, edge_index)))
+                        count += 1
+
+    def expand(self, relationship):
+        # Yield (person, edge, index) for everyone the walk may step to from the given relationship.
+        if self.max_relationship_path_length != -1 and relationship.length >= self.max_relationship_path_length:
+            return
+        person = relationship.person
+        if not self.avoid_inlaws or not relationship.spouse_in_path():
+            if person.mother is not None:
+                yield person.mother, 'mother', -1
+            if person.father is not None:
+                yield person.father, 'father', -1
+        if hasattr(person, 'spouse_list') and not self.avoid_spouses:
+            for i, spouse in enumerate(person.spouse_list):
+                yield spouse, 'spouse', i
+        if hasattr(person, 'child_list'):
+            for i, child in enumerate(person.child_list):
+                yield child, 'child', i
 
     def visit(self, relationship):
+        if self.load_func is not None:
+            self.load_func(relationship.person)
         if self.visitation_func is not None:
-            return self.visitation_func(relationship, self.visitation_data)
\ No newline at end of file
+            return self.visitation_func(relationship, self.visitation_data)
@@ -0,0 +1,260 @@
+# gedcom_date.py
+
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+class GedcomCalendarDate(object):
+    # A single calendar date as it appears in a GEDCOM date value.  Only the year is required.
+
+    gregorian_month_list = ['JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC']
+    english_month_list = ['JANUARY', 'FEBRUARY', 'MARCH', 'APRIL', 'MAY', 'JUNE', 'JULY', 'AUGUST', 'SEPTEMBER', 'OCTOBER', 'NOVEMBER', 'DECEMBER']
+    french_month_list = ['VEND', 'BRUM', 'FRIM', 'NIVO', 'PLUV', 'VENT', 'GERM', 'FLOR', 'PRAI', 'MESS', 'THER', 'FRUC', 'COMP']
+    hebrew_month_list = ['TSH', 'CSH', 'KSL', 'TVT', 'SHV', 'ADR', 'ADS', 'NSN', 'IYR', 'SVN', 'TMZ', 'AAV', 'ELL']
+
+    def __init__(self, calendar, day, month, year, dual_year=None, before_christ=False):
+        self.calendar = calendar
+        self.day = day
+        self.month = month
+        self.year = year
+        self.dual_year = dual_year
+        self.before_christ = before_christ
+
+    def to_datetime(self):
+        # Missing parts of the date are taken to be the first of their kind, which is what strptime does too.
+        # We can only do this for the calendars that Python's datetime can represent.
+        if self.before_christ:
+            return None
+        year = self.dual_year if self.dual_year is not None else self.year
+        month = self.month if self.month is not None else 1
+        day = self.day if self.day is not None else 1
+        try:
+            if self.calendar == 'GREGORIAN':
+                return datetime(year, month, day)
+            elif self.calendar == 'JULIAN':
+                # Go through the Julian day number to land on the proleptic Gregorian calendar.
+                days_in_month = [31, 29 if year % 4 == 0 else 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31][month - 1]
+                if day < 1 or day > days_in_month:
+                    return None
+                a = (14 - month) // 12
+                y = year + 4800 - a
+                m = month + 12 * a - 3
+                julian_day_number = day + (153 * m + 2) // 5 + 365 * y + y // 4 - 32083
+                return datetime.fromordinal(julian_day_number - 1721425)
+        except ValueError:
+            pass
+        return None
+
+    @staticmethod
+    def month_list(calendar):
+        if calendar == 'FRENCH R':
+            return GedcomCalendarDate.french_month_list
+        elif calendar == 'HEBREW':
+            return GedcomCalendarDate.hebrew_month_list
+        return GedcomCalendarDate.gregorian_month_list
+
+class GedcomDate(object):
+    # A parsed GEDCOM date value.  The qualifier is one of ABT, CAL, EST, BEF, AFT, BET, FROM, TO or INT, or None
+    # for a plain date.  Ranges (BET...AND) and periods (FROM...TO) have a second date.  Phrases are kept as text.
+
+    def __init__(self, qualifier, first_date, second_date=None, phrase=None):
+        self.qualifier = qualifier
+        self.first_date = first_date
+        self.second_date = second_date
+        self.phrase = phrase
+        self.datetime = self.calc_datetime()
+
+    def calc_datetime(self):
+        # Boil the value down to the single date that best represents it.  Approximations and
+        # one-sided ranges are taken at face value, while two-sided ranges use the day at their midpoint.
+        first_datetime = self.first_date.to_datetime() if self.first_date is not None else None
+        second_datetime = self.second_date.to_datetime() if self.second_date is not None else None
+        if first_datetime is not None and second_datetime is not None:
+            return first_datetime + timedelta(days=(second_datetime - first_datetime).days // 2)
+        return first_datetime if first_datetime is not None else second_datetime
+
+    def to_datetime(self):
+        return self.datetime
+
+    def is_exact(self):
+        return self.qualifier is None and self.second_date is None and self.first_date is not None
+
+def tokenize_gedcom_date(date_text):
+    # Break the given date value into (kind, text) pairs, where the kind is one of
+    # WORD, NUMBER, DUAL, CALENDAR or PHRASE.  Anything else is reported as OTHER.
+    token_list = []
+    i = 0
+    n = len(date_text)
+    while i < n:
+        char = date_text[i]
+        if char.isspace():
+            i += 1
+        elif char == '(':
+            j = date_text.find(')', i + 1)
+            j = n if j < 0 else j
+            token_list.append(('PHRASE', date_text[i + 1:j]))
+            i = j + 1
+        elif char == '@':
+            j = date_text.find('@', i + 1)
+            if j < 0 or date_text[i + 1:i + 3] != '#D':
+                token_list.append(('OTHER', date_text[i:]))
+                break
+            token_list.append(('CALENDAR', date_text[i + 3:j].upper()))
+            i = j + 1
+        elif char.isdigit():
+            j = i
+            while j < n and date_text[j].isdigit():
+                j += 1
+            token_list.append(('NUMBER', date_text[i:j]))
+            if j + 1 < n and date_text[j] == '/' and date_text[j + 1].isdigit():
+                i = j + 1
+                j = i
+                while j < n and date_text[j].isdigit():
+                    j += 1
+                token_list.append(('DUAL', date_text[i:j]))
+            i = j
+        elif char.isalpha():
+            j = i
+            while j < n and (date_text[j].isalpha() or date_text[j] == '.'):
+                j += 1
+            token_list.append(('WORD', date_text[i:j].upper()))
+            i = j
+        else:
+            token_list.append(('OTHER', char))
+            i += 1
+    return token_list
+
+class GedcomDateParser(object):
+    # A small recursive-descent parser over the tokens of a single GEDCOM date value.
+
+    approximation_list = ['ABT', 'CAL', 'EST']
+    before_christ_list = ['B.C.', 'BC', 'BCE', 'B.C.E.']
+
+    def __init__(self, token_list):
+        self.token_list = token_list
+        self.i = 0
+
+    def peek(self, kind=None):
+        if self.i < len(self.token_list):
+            token = self.token_list[self.i]
+            if kind is None or token[0] == kind:
+                return token
+        return None
+
+    def peek_word(self, word_list):
+        token = self.peek('WORD')
+        return token is not None and token[1] in word_list
+
+    def take(self):
+        token = self.token_list[self.i]
+        self.i += 1
+        return token
+
+    def parse(self):
+        date = self.parse_value()
+        if date is None or self.i < len(self.token_list):
+            return None
+        return date
+
+    def parse_value(self):
+        token = self.peek()
+        if token is None:
+            return None
+        if token[0] == 'PHRASE':
+            return GedcomDate(None, None, phrase=self.take()[1])
+        if token[0] == 'WORD':
+            word = token[1]
+            if word in self.approximation_list or word in ['BEF', 'AFT']:
+                self.take()
+                return self.make(word, self.parse_calendar_date())
+            elif word == 'BET':
+                self.take()
+                first_date = self.parse_calendar_date()
+                if not self.peek_word(['AND']):
+                    return None
+                self.take()
+                second_date = self.parse_calendar_date()
+                if first_date is None or second_date is None:
+                    return None
+                return self.make(word, first_date, second_date)
+            elif word == 'FROM':
+                self.take()
+                first_date = self.parse_calendar_date()
+                second_date = None
+                if self.peek_word(['TO']):
+                    self.take()
+                    second_date = self.parse_calendar_date()
+                    if second_date is None:
+                        return None
+                return self.make(word, first_date, second_date)
+            elif word == 'TO':
+                self.take()
+                return self.make(word, None, self.parse_calendar_date())
+            elif word == 'INT':
+                self.take()
+                first_date = self.parse_calendar_date()
+                phrase = self.take()[1] if self.peek('PHRASE') is not None else None
+                return self.make(word, first_date, phrase=phrase)
+        return self.make(None, self.parse_calendar_date())
+
+    def make(self, qualifier, first_date, second_date=None, phrase=None):
+        if first_date is None and second_date is None:
+            return None
+        return GedcomDate(qualifier, first_date, second_date, phrase)
+
+    def parse_calendar_date(self):
+        calendar = None
+        if self.peek('CALENDAR') is not None:
+            calendar = self.take()[1]
+            if calendar not in ['GREGORIAN', 'JULIAN', 'HEBREW', 'FRENCH R', 'ROMAN', 'UNKNOWN']:
+                return None
+
+        day = None
+        month = None
+        if self.peek('NUMBER') is not None and self.i + 1 < len(self.token_list):
+            token = self.token_list[self.i + 1]
+            if token[0] == 'WORD' and self.lookup_month(token[1], calendar)[0] is not None:
+                day = int(self.take()[1])
+        token = self.peek('WORD')
+        if token is not None:
+            month, month_calendar = self.lookup_month(token[1], calendar)
+            if month is None:
+                return None
+            self.take()
+            calendar = month_calendar
+
+        if self.peek('NUMBER') is None:
+            return None
+        year = int(self.take()[1])
+
+        dual_year = None
+        if self.peek('DUAL') is not None:
+            # E.g., 1699/00 is the year 1699 by the old reckoning and 1700 by the new.
+            dual_text = self.take()[1]
+            year_text = str(year)
+            dual_year = int(year_text[:max(len(year_text) - len(dual_text), 0)] + dual_text)
+            if dual_year < year:
+                dual_year += 10 ** len(dual_text)
+
+        before_christ = False
+        if self.peek_word(self.before_christ_list):
+            self.take()
+            before_christ = True
+
+        return GedcomCalendarDate(calendar if calendar is not None else 'GREGORIAN', day, month, year, dual_year, before_christ)
+
+    def lookup_month(self, word, calendar):
+        # Without a calendar escape, the month itself tells us which calendar is being used.
+        calendar_list = [calendar] if calendar is not None else ['GREGORIAN', 'FRENCH R', 'HEBREW']
+        for month_calendar in calendar_list:
+            month_list = GedcomCalendarDate.month_list(month_calendar)
+            if word in month_list:
+                return month_list.index(word) + 1, month_calendar
+            if month_calendar in ['GREGORIAN', 'JULIAN'] and word in GedcomCalendarDate.english_month_list:
+                return GedcomCalendarDate.english_month_list.index(word) + 1, month_calendar
+        return None, None
+
+@lru_cache(maxsize=8192)
+def parse_gedcom_date(date_text):
+    # Parse the given GEDCOM date value into a GedcomDate, or return None if it isn't one.
+    # A family tree only ever has so many distinct date strings, so results are memoized.
+    return GedcomDateParser(tokenize_gedcom_date(date_text)).parse()
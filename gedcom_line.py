@@ -1,10 +1,22 @@
 # gedcom_line.py
 
+import sys
+
 from gedcom_exception import GedcomException
 
 class GedcomLine(object):
+    # Large transmissions are made of millions of these, so they are kept as small as we can make them.
+    # There is no per-instance dictionary, leaf lines all share the same empty sub-line list, and tags,
+    # which come from a small vocabulary, are interned.  Meta-data is cleared rather than deleted so that
+    # every instance has the same fixed layout.
+
+    __slots__ = ('level', 'xref_id', 'tag', 'value', 'pointer', 'sub_line_list', 'sub_line_map')
+
+    empty_sub_line_list = ()
+
     def __init__(self, line_text):
-        self.sub_line_list = []
+        self.sub_line_list = self.empty_sub_line_list
+        self.sub_line_map = None    # Index of direct sub-lines by tag; see add_sub_line.
 
         token_list = line_text.split()
 
@@ -21,7 +33,7 @@ class GedcomLine(object):
             i = 1
 
         if len(token_list) > i:
-            self.tag = token_list[i]
+            self.tag = sys.intern(token_list[i])
         else:
             self.tag = None
 
@@ -34,6 +46,16 @@ class GedcomLine(object):
         # but we need a way to preserve the pointer when generating meta-data.
         self.pointer = None
 
+    def add_sub_line(self, line):
+        if self.sub_line_map is None:
+            self.sub_line_list = []
+            self.sub_line_map = {}
+        self.sub_line_list.append(line)
+        if line.tag in self.sub_line_map:
+            self.sub_line_map[line.tag].append(line)
+        else:
+            self.sub_line_map[line.tag] = [line]
+
     def patch_pointer(self, xref_map):
         # Use the given map to patch cross-references made from one GEDCOM line to another.
         if type(self.value) is list and len(self.value) > 0 and type(self.value[0]) is str:
@@ -48,10 +70,8 @@ class GedcomLine(object):
     def delete_metadata(self):
         # Here we remove any meta-data that was only used during the sending or receiving process.
         # What remains is just the data that constitutes the substance of the GEDCOM transmission.
-        if hasattr(self, 'level'):
-            del self.level
-        if hasattr(self, 'xref_id'):
-            del self.xref_id
+        self.level = None
+        self.xref_id = None
         if self.pointer is not None:
             self.value = []
         for line in self.sub_line_list:
@@ -59,13 +79,13 @@ class GedcomLine(object):
 
     def generate_metadata(self, metadata_map):
         if self.pointer is not None:
-            if not hasattr(self.pointer, 'xref_id'):
-                setattr(self.pointer, 'xref_id', '@ref%d@' % metadata_map['next_id'])
+            if self.pointer.xref_id is None:
+                self.pointer.xref_id = '@ref%d@' % metadata_map['next_id']
                 metadata_map['next_id'] += 1
             self.value = [self.pointer.xref_id]
 
     def print(self, output_stream, level):
-        if hasattr(self, 'xref_id') and self.xref_id is not None:
+        if self.xref_id is not None:
             line_text = '%d %s %s %s' % (level, self.xref_id, self.tag, ' '.join(self.value))
         else:
             line_text = '%d %s %s' % (level, self.tag, ' '.join(self.value))
@@ -81,6 +101,21 @@ class GedcomLine(object):
             if found_line is not None:
                 return found_line
 
+    def find_child_line(self, tag_path):
+        # Unlike find_sub_line, this only looks at direct sub-lines, and it does so using the tag index.
+        # The given path may reach further down by separating tags with dots; e.g., "BIRT.DATE".
+        line = self
+        for tag_name in tag_path.split('.'):
+            if line.sub_line_map is None or tag_name not in line.sub_line_map:
+                return None
+            line = line.sub_line_map[tag_name][0]
+        return line
+
+    def find_all_child_lines(self, tag_name):
+        if self.sub_line_map is None or tag_name not in self.sub_line_map:
+            return []
+        return self.sub_line_map[tag_name]
+
     def find_all_sub_lines(self, tag_name, line_list):
         if self.tag == tag_name:
             line_list.append(self)
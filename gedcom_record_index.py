@@ -0,0 +1,132 @@
+# gedcom_record_index.py
+
+import io
+import hashlib
+
+from gedcom_exception import GedcomException
+from gedcom_transmission import GedcomTransmission
+
+class GedcomRecordEntry(object):
+    # Where a level-0 record is found in a GEDCOM file, and a fingerprint of its content.
+
+    __slots__ = ('xref_id', 'tag', 'offset', 'length', 'fingerprint')
+
+    def __init__(self, xref_id, tag, offset, length, fingerprint):
+        self.xref_id = xref_id
+        self.tag = tag
+        self.offset = offset
+        self.length = length
+        self.fingerprint = fingerprint
+
+class GedcomRecordIndex(object):
+    # A quick scan over the raw bytes of a GEDCOM file that finds every level-0 record without parsing any of them.
+    # Records can then be parsed one at a time, as needed.  Two records with the same fingerprint have the same text,
+    # so comparing fingerprints tells us which records changed between two versions of a file.
+    #
+    # Along the way, the scan also picks out the few lines needed to find our way around the family tree without
+    # parsing it: the family search ID of each individual, and the husband, wife and children of each family.
+
+    link_line_prefix_tuple = (b'1 _FSFTID ', b'1 HUSB ', b'1 WIFE ', b'1 CHIL ')
+
+    def __init__(self, in_file):
+        self.in_file = in_file
+        self.entry_list = []
+        self.entry_map = {}                 # Record key to entry; see entry_key.
+        self.family_search_id_map = {}      # Family search ID to individual record key.
+        self.family_member_map = {}         # Family record key to (husband key, wife key, child key list.)
+        self.person_family_map = {}         # Individual record key to the keys of the families they're in, in file order.
+        self.max_block_record_count = 4096  # Most records read_records parses together; one parses a record at a time.
+
+    def entry_key(self, entry):
+        # A record without an xref ID can't be referred to, but it should still be told apart from the others.
+        return entry.xref_id if entry.xref_id is not None else '@%d@' % entry.offset
+
+    def scan(self):
+        self.entry_list = []
+        self.entry_map = {}
+        self.family_search_id_map = {}
+        self.family_member_map = {}
+        self.person_family_map = {}
+        with open(self.in_file, 'rb') as handle:
+            offset = 0
+            line_list = None
+            start_offset = 0
+            first_token_list = None
+            link_line_list = []
+            for line in handle:
+                if offset == 0 and line.startswith(b'\xef\xbb\xbf'):
+                    # Skip the byte-order mark, as reading the file as utf-8-sig would.
+                    offset += 3
+                    line = line[3:]
+                stripped_line = line.lstrip()
+                if stripped_line[:2] == b'0 ':
+                    if line_list is not None:
+                        self.add_entry(first_token_list, start_offset, offset - start_offset, line_list, link_line_list)
+                    line_list = [line]
+                    start_offset = offset
+                    first_token_list = line.split(None, 3)
+                    link_line_list = []
+                elif line_list is not None:
+                    line_list.append(line)
+                    if stripped_line.startswith(self.link_line_prefix_tuple):
+                        link_line_list.append(stripped_line)
+                offset += len(line)
+            if line_list is not None:
+                self.add_entry(first_token_list, start_offset, offset - start_offset, line_list, link_line_list)
+
+    def add_entry(self, first_token_list, offset, length, line_list, link_line_list):
+        fingerprint = hashlib.blake2b(b''.join(line_list), digest_size=16).digest()
+        if len(first_token_list) > 2 and first_token_list[1][:1] == b'@':
+            xref_id = first_token_list[1].decode('utf-8')
+            tag = first_token_list[2].decode('utf-8')
+        else:
+            xref_id = None
+            tag = first_token_list[1].decode('utf-8') if len(first_token_list) > 1 else None
+        entry = GedcomRecordEntry(xref_id, tag, offset, length, fingerprint)
+        self.entry_list.append(entry)
+        key = self.entry_key(entry)
+        self.entry_map[key] = entry
+        if tag == 'INDI':
+            for link_line in link_line_list:
+                token_list = link_line.split()
+                # As when parsing, only the first such line counts.
+                if len(token_list) > 2 and token_list[1] == b'_FSFTID':
+                    self.family_search_id_map[token_list[2].decode('utf-8')] = key
+                    break
+        elif tag == 'FAM':
+            pointer_map = {}
+            child_key_list = []
+            for link_line in link_line_list:
+                token_list = link_line.split()
+                if len(token_list) > 2 and token_list[1] != b'_FSFTID':
+                    if token_list[1] == b'CHIL':
+                        child_key_list.append(token_list[2].decode('utf-8'))
+                    elif token_list[1] not in pointer_map:
+                        pointer_map[token_list[1]] = token_list[2].decode('utf-8')
+            husband_key = pointer_map.get(b'HUSB')
+            wife_key = pointer_map.get(b'WIFE')
+            self.family_member_map[key] = (husband_key, wife_key, child_key_list)
+            for member_key in [husband_key, wife_key] + child_key_list:
+                if member_key is not None:
+                    family_key_list = self.person_family_map.setdefault(member_key, [])
+                    if len(family_key_list) == 0 or family_key_list[-1] != key:
+                        family_key_list.append(key)
+
+    def read_records(self, entry_list):
+        # Parse and generate the records of the given entries, which should be in file order.  Neighboring records are
+        # read together, so reading every record costs about as much as reading the whole file in one go.
+        transmission = GedcomTransmission()
+        with open(self.in_file, 'rb') as handle:
+            i = 0
+            while i < len(entry_list):
+                j = i + 1
+                while j < len(entry_list) and entry_list[j].offset == entry_list[j - 1].offset + entry_list[j - 1].length and j - i < self.max_block_record_count:
+                    j += 1
+                handle.seek(entry_list[i].offset)
+                block = handle.read(entry_list[j - 1].offset + entry_list[j - 1].length - entry_list[i].offset)
+                record_list = list(transmission.recv_records(io.StringIO(block.decode('utf-8'))))
+                if len(record_list) != j - i:
+                    raise GedcomException('GEDCOM file %s changed while it was being read.' % self.in_file)
+                for record in record_list:
+                    yield record
+                i = j
@@ -16,6 +16,19 @@ class GedcomTransmission(object):
         # Receive a self-contained GEDCOM transmission from the given input stream.
 
         xref_map = {}   # This is used to link cross-references during reception of the transmission.
+        for record in self.recv_records(input_stream, xref_map):
+            self.record_list.append(record)
+        for line in self.record_list:
+            line.patch_pointer(xref_map)
+        for line in self.record_list:
+            line.delete_metadata()
+
+    def recv_records(self, input_stream, xref_map=None):
+        # Receive a GEDCOM transmission from the given input stream one level-0 record at a time.
+        # Each record is yielded as soon as the next one begins, so the caller never has to hold
+        # the whole transmission in memory.  Cross-references are not patched here; pointer lines
+        # keep their xref ID as their value so that the caller can resolve them however it likes.
+
         line_stack = None
         line_number = 0
         while input_stream.readable():
@@ -23,28 +36,27 @@ class GedcomTransmission(object):
             line_text = input_stream.readline()
             if len(line_text) == 0:
                 break
+            record = None
             try:
                 line = GedcomLine(line_text)
                 if line.level == 0:
                     if line_stack is not None and len(line_stack) > 0:
-                        self.record_list.append(line_stack[0])
+                        record = line_stack[0]
                     line_stack = [line]
                 else:
                     parent = line_stack[line.level - 1]
-                    parent.sub_line_list.append(line)
+                    parent.add_sub_line(line)
                     while len(line_stack) > line.level:
                         line_stack.pop()
                     line_stack.append(line)
-                if line.xref_id is not None:
+                if xref_map is not None and line.xref_id is not None:
                     xref_map[line.xref_id] = line
             except Exception as ex:
                 raise GedcomException('Failed to parse line %d.' % line_number) from ex
+            if record is not None:
+                yield record
         if line_stack is not None and len(line_stack) > 0:
-            self.record_list.append(line_stack[0])
-        for line in self.record_list:
-            line.patch_pointer(xref_map)
-        for line in self.record_list:
-            line.delete_metadata()
+            yield line_stack[0]
 
     def send(self, output_stream):
         metadata_map = {'next_id': 0}
@@ -54,4 +66,4 @@ class GedcomTransmission(object):
         for line in self.record_list:
             line.print(output_stream, level)
         for line in self.record_list:
-            line.delete_metadata()
\ No newline at end of file
+            line.delete_metadata()
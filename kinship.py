@@ -0,0 +1,227 @@
+# kinship.py
+
+# Here we put names to relationship paths, those lists of (edge, index) components leading from one person to another
+# (see Relationship.path.)  A path is first boiled down to steps up to a parent, down to a child, or across to a spouse.
+# Note that in our data-structures, only a woman has children and only a man has spouses, so a man's child is reached
+# by way of one of his wives, and a woman's husband by way of one of her children; such detours are straightened out.
+# The steps are then grouped into segments, each going up some number of generations and then down some number
+# (e.g., up two and down two makes a first cousin), or across to a spouse, and each segment, or pair of segments
+# that has a name of its own (e.g., a spouse's father is a father-in-law), is named.
+#
+# Whether a person is male or female is told by whether they have spouses or children, so that this doesn't depend
+# on the person classes themselves.
+
+def follow_path(root_person, path):
+    # Return the list of persons met along the given path, starting with the given root person.
+    person_list = [root_person]
+    for edge, index in path:
+        person = person_list[-1]
+        if edge == 'mother':
+            person = person.mother
+        elif edge == 'father':
+            person = person.father
+        elif edge == 'spouse':
+            person = person.spouse_list[index]
+        elif edge == 'child':
+            person = person.child_list[index]
+        else:
+            raise Exception('Unknown component: %s' % edge)
+        person_list.append(person)
+    return person_list
+
+def kinship_steps(person_list, path):
+    # Return a list of (step, i), where the step is 'up', 'down' or 'across', and i is the position in the given
+    # person list of whoever the step leads to.
+    step_list = []
+    i = 0
+    while i < len(path):
+        edge = path[i][0]
+        if edge == 'mother' or edge == 'father':
+            step_list.append(('up', i + 1))
+        elif edge == 'child':
+            step_list.append(('down', i + 1))
+        elif i + 1 < len(path) and path[i + 1][0] == 'child' and person_list[i + 2].father is person_list[i]:
+            # A man's own child, by way of the child's mother.
+            step_list.append(('down', i + 2))
+            i += 1
+        else:
+            step_list.append(('across', i + 1))
+        i += 1
+
+    # Going down to a child and back up to the child's other parent is just going across to a spouse.
+    merged_step_list = []
+    for step, i in step_list:
+        if step == 'up' and len(merged_step_list) > 0 and merged_step_list[-1][0] == 'down':
+            before_person = person_list[merged_step_list[-2][1] if len(merged_step_list) > 1 else 0]
+            child = person_list[merged_step_list[-1][1]]
+            parent = person_list[i]
+            if parent is not before_person and (parent is child.mother or parent is child.father):
+                merged_step_list[-1] = ('across', i)
+                continue
+        merged_step_list.append((step, i))
+    return merged_step_list
+
+def kinship_segments(person_list, step_list, keep_person_set=None):
+    # Group the given steps into a list of (up count, down count, start, position list, kept) segments, where start is
+    # the position in the person list of whoever the segment starts from, and the position list holds the positions of
+    # whoever each of its steps leads to.  A step across to a spouse is a segment of its own, with counts of -1.
+    # Segments also end wherever a person in the given set is met, in which case the segment is marked as kept,
+    # meaning that it mustn't be named together with the next one, lest that person be skipped over.
+    segment_list = []
+    start = 0
+    up_count = 0
+    down_count = 0
+    position_list = []
+    for j, (step, i) in enumerate(step_list):
+        if len(position_list) > 0 and (step == 'across' or (step == 'up' and down_count > 0)):
+            segment_list.append((up_count, down_count, start, position_list, False))
+            start = position_list[-1]
+            up_count = 0
+            down_count = 0
+            position_list = []
+        if step == 'across':
+            segment_list.append((-1, -1, start, [i], False))
+            start = i
+        else:
+            if step == 'up':
+                up_count += 1
+            else:
+                down_count += 1
+            position_list.append(i)
+        if keep_person_set is not None and person_list[i] in keep_person_set and j + 1 < len(step_list):
+            if step == 'across':
+                segment_list[-1] = segment_list[-1][:4] + (True,)
+            else:
+                segment_list.append((up_count, down_count, start, position_list, True))
+                start = i
+                up_count = 0
+                down_count = 0
+                position_list = []
+    if len(position_list) > 0:
+        segment_list.append((up_count, down_count, start, position_list, False))
+    return segment_list
+
+def gendered(person, male_word, female_word, neutral_word):
+    if hasattr(person, 'spouse_list'):
+        return male_word
+    if hasattr(person, 'child_list'):
+        return female_word
+    return neutral_word
+
+def ordinal_suffix(number):
+    if 10 <= number % 100 <= 20:
+        return 'th'
+    return {1: 'st', 2: 'nd', 3: 'rd'}.get(number % 10, 'th')
+
+def ordinal(number):
+    ordinal_map = {1: 'first', 2: 'second', 3: 'third', 4: 'fourth', 5: 'fifth', 6: 'sixth', 7: 'seventh', 8: 'eighth', 9: 'ninth'}
+    return ordinal_map.get(number, '%d%s' % (number, ordinal_suffix(number)))
+
+def grand_prefix(generation_count):
+    # E.g., 2 makes a grandfather, 3 a great-grandfather, and 4 a 2nd great-grandfather.
+    if generation_count <= 1:
+        return ''
+    if generation_count == 2:
+        return 'grand'
+    if generation_count == 3:
+        return 'great-grand'
+    number = generation_count - 2
+    return '%d%s great-grand' % (number, ordinal_suffix(number))
+
+def great_prefix(generation_count):
+    # E.g., 2 makes an uncle, 3 a great-uncle, and 4 a 2nd great-uncle.
+    if generation_count <= 2:
+        return ''
+    return grand_prefix(generation_count)[:-len('grand')]
+
+def is_half_blood(x, y):
+    # Tell whether the given persons, having a parent in common, don't also have the other parent in common.  A parent
+    # missing on both sides counts as shared, so that siblings with no recorded father are still full siblings.
+    return x.mother is not y.mother or x.father is not y.father
+
+def name_segment(person_list, segment):
+    up_count, down_count, start, position_list, kept = segment
+    person = person_list[position_list[-1]]
+    if up_count == -1:
+        return gendered(person, 'husband', 'wife', 'spouse')
+    if up_count == 0 or down_count == 0:
+        return name_blood_relationship(up_count, down_count, person, False)
+
+    # Somewhere between the two sides of the segment is a common ancestor, whose children on either
+    # side are the ones to compare to know whether the relationship is by half blood.
+    x = person_list[position_list[up_count - 2]] if up_count > 1 else person_list[start]
+    y = person_list[position_list[up_count]]
+    return name_blood_relationship(up_count, down_count, person, is_half_blood(x, y))
+
+def name_blood_relationship(up_count, down_count, person, half):
+    # Name the given person, found by going up the given number of generations from someone to a common ancestor,
+    # then down the given number.  The relationship is by half blood if the common ancestor's children on either
+    # side have only one parent in common.
+    if down_count == 0:
+        return grand_prefix(up_count) + gendered(person, 'father', 'mother', 'parent')
+    if up_count == 0:
+        return grand_prefix(down_count) + gendered(person, 'son', 'daughter', 'child')
+    half = 'half-' if half else ''
+    if up_count == 1 and down_count == 1:
+        return half + gendered(person, 'brother', 'sister', 'sibling')
+    if down_count == 1:
+        return half + great_prefix(up_count) + gendered(person, 'uncle', 'aunt', 'aunt/uncle')
+    if up_count == 1:
+        return half + grand_prefix(down_count - 1) + gendered(person, 'nephew', 'niece', 'niece/nephew')
+    name = half + ordinal(min(up_count, down_count) - 1) + ' cousin'
+    removed_count = abs(up_count - down_count)
+    if removed_count > 0:
+        name += ' ' + {1: 'once', 2: 'twice'}.get(removed_count, '%d times' % removed_count) + ' removed'
+    return name
+
+def name_segment_pair(person_list, first_segment, second_segment):
+    # Return the name of the given pair of segments, if there's one for them together, otherwise None.
+    if first_segment[4]:
+        return None
+    return name_relationship_pair(first_segment[:2], second_segment[:2], person_list[second_segment[3][-1]])
+
+def name_relationship_pair(first_counts, second_counts, person):
+    # Name the given person, found by way of two relationships, each given by its (up count, down count), where
+    # (-1, -1) is a spouse, if there's a name for the two together.  Otherwise, return None.
+    if first_counts == (-1, -1):
+        if second_counts == (1, 0):
+            return gendered(person, 'father', 'mother', 'parent') + '-in-law'
+        if second_counts == (1, 1):
+            return gendered(person, 'brother', 'sister', 'sibling') + '-in-law'
+        if second_counts == (0, 1):
+            return gendered(person, 'stepson', 'stepdaughter', 'stepchild')
+    elif second_counts == (-1, -1):
+        if first_counts == (1, 0):
+            return gendered(person, 'stepfather', 'stepmother', 'stepparent')
+        if first_counts == (1, 1):
+            return gendered(person, 'brother', 'sister', 'sibling') + '-in-law'
+        if first_counts == (0, 1):
+            return gendered(person, 'son', 'daughter', 'child') + '-in-law'
+    return None
+
+def kinship_hops(root_person, path, keep_person_set=None):
+    # Return the given path as a list of (name, person) hops, each hop being a named relationship from the person
+    # at the end of the previous hop, or from the root person.  Nobody in the given set is ever skipped over.
+    person_list = follow_path(root_person, path)
+    if len(path) == 0:
+        return []
+    segment_list = kinship_segments(person_list, kinship_steps(person_list, path), keep_person_set)
+    hop_list = []
+    i = 0
+    while i < len(segment_list):
+        if i + 1 < len(segment_list):
+            name = name_segment_pair(person_list, segment_list[i], segment_list[i + 1])
+            if name is not None:
+                hop_list.append((name, person_list[segment_list[i + 1][3][-1]]))
+                i += 2
+                continue
+        hop_list.append((name_segment(person_list, segment_list[i]), person_list[segment_list[i][3][-1]]))
+        i += 1
+    return hop_list
+
+def describe_relationship(root_person, path):
+    # E.g., "mother's first cousin once removed" or "half-brother-in-law".
+    hop_list = kinship_hops(root_person, path)
+    if len(hop_list) == 0:
+        return 'self'
+    return '\'s '.join([name for name, person in hop_list])
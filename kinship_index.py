@@ -0,0 +1,106 @@
+# kinship_index.py
+
+from collections import deque
+from kinship import gendered, is_half_blood, name_blood_relationship, name_relationship_pair
+
+class KinshipIndex(object):
+    # Tells how any two persons are related without walking the family tree outward from either of them.  Each person
+    # gets an ancestor map, labeling every one of their ancestors with how many generations up they are; it's made the
+    # first time it's needed and kept from then on.  Two persons are related by blood through whichever ancestor they
+    # have in common is closest, which is found by intersecting their ancestor maps, and by marriage if one of them is
+    # related by blood to a spouse of the other.
+    #
+    # A pedigree isn't a tree: everyone has two parents, and with pedigree collapse two persons can have more than one
+    # lowest common ancestor, which is why tree structures (e.g., an Euler tour with a sparse table, or binary lifting)
+    # aren't used here.  A query costs about as much as the smaller of the two ancestor maps, which is next to nothing
+    # compared to walking the tree, and nothing at all is done for persons that are never asked about.
+    #
+    # The family-tree data is asked to load each person before their parents are looked at (see LazyFamilyTreeData.)
+
+    def __init__(self, family_tree_data):
+        super().__init__()
+        self.family_tree_data = family_tree_data
+        self.ancestor_map_map = {}
+
+    def ancestor_map(self, person):
+        # Return a map from each ancestor of the given person, including the person themselves, to (generation count,
+        # child), where the child is the one through whom the ancestor is reached the shortest way up.
+        ancestor_map = self.ancestor_map_map.get(person)
+        if ancestor_map is None:
+            ancestor_map = {person: (0, None)}
+            queue = deque([person])
+            while len(queue) > 0:
+                descendant = queue.popleft()
+                generation_count = ancestor_map[descendant][0] + 1
+                self.family_tree_data.load_person(descendant)
+                for parent in [descendant.mother, descendant.father]:
+                    if parent is not None and parent not in ancestor_map:
+                        ancestor_map[parent] = (generation_count, descendant)
+                        queue.append(parent)
+            self.ancestor_map_map[person] = ancestor_map
+        return ancestor_map
+
+    def blood_relationship(self, person_a, person_b):
+        # Return (up count, down count, half) for going from the first person up to the closest ancestor they have in
+        # common with the second, then down to the second; or None if they aren't related by blood.
+        ancestor_map_a = self.ancestor_map(person_a)
+        ancestor_map_b = self.ancestor_map(person_b)
+        if len(ancestor_map_a) <= len(ancestor_map_b):
+            smaller_map, larger_map = ancestor_map_a, ancestor_map_b
+        else:
+            smaller_map, larger_map = ancestor_map_b, ancestor_map_a
+        best = None
+        for ancestor in smaller_map:
+            if ancestor in larger_map:
+                up_count, child_a = ancestor_map_a[ancestor]
+                down_count, child_b = ancestor_map_b[ancestor]
+                if best is None or up_count + down_count <= best[0] + best[1]:
+                    # With pedigree collapse, there can be more than one closest common ancestor, in which case
+                    # being related by full blood through any of them makes the relationship one by full blood.
+                    half = up_count > 0 and down_count > 0 and is_half_blood(child_a, child_b)
+                    if best is None or up_count + down_count < best[0] + best[1] or (best[2] and not half):
+                        best = (up_count, down_count, half)
+        return best
+
+    def relate(self, person_a, person_b):
+        # Return (kinship steps, name), where the name says what the second person is to the first (e.g., "first
+        # cousin") and each generation up or down between them, and each marriage, is one kinship step; or None if
+        # they aren't related by blood, or by blood to a spouse of the other.  Note that a walker's relationship
+        # length is different, e.g., a man's child is two steps away from him there, by way of the child's mother.
+        if person_a is person_b:
+            return 0, 'self'
+
+        best = None
+        blood_relationship = self.blood_relationship(person_a, person_b)
+        if blood_relationship is not None:
+            up_count, down_count, half = blood_relationship
+            best = (up_count + down_count, name_blood_relationship(up_count, down_count, person_b, half))
+
+        spouse_name = gendered(person_b, 'husband', 'wife', 'spouse')
+        for spouse in self.family_tree_data.find_spouses(person_b):
+            blood_relationship = self.blood_relationship(person_a, spouse)
+            if blood_relationship is not None:
+                up_count, down_count, half = blood_relationship
+                if best is None or up_count + down_count + 1 < best[0]:
+                    if up_count + down_count == 0:
+                        name = spouse_name
+                    else:
+                        name = name_relationship_pair((up_count, down_count), (-1, -1), person_b)
+                        if name is None:
+                            name = name_blood_relationship(up_count, down_count, spouse, half) + '\'s ' + spouse_name
+                    best = (up_count + down_count + 1, name)
+
+        for spouse in self.family_tree_data.find_spouses(person_a):
+            blood_relationship = self.blood_relationship(spouse, person_b)
+            if blood_relationship is not None:
+                up_count, down_count, half = blood_relationship
+                if best is None or up_count + down_count + 1 < best[0]:
+                    if up_count + down_count == 0:
+                        name = spouse_name
+                    else:
+                        name = name_relationship_pair((-1, -1), (up_count, down_count), person_b)
+                        if name is None:
+                            name = gendered(spouse, 'husband', 'wife', 'spouse') + '\'s ' + name_blood_relationship(up_count, down_count, person_b, half)
+                    best = (up_count + down_count + 1, name)
+
+        return best
@@ -1,17 +1,104 @@
 # render_tree.py
 
+import math
+
+from xml.sax.saxutils import escape
+from PIL import Image, ImageDraw
 from math2d_vector import Vector
 from math2d_aa_rect import AxisAlignedRectangle
-from math2d_affine_transform import AffineTransform
+from kinship import kinship_hops
+
+class TextMetrics(object):
+    # Measuring text with Pillow is slow, and rendering a tree measures the same text over and over: every label
+    # during layout and again while drawing, and the same few edge keys (Mother, Child 3, Spouse 1, ...) on every edge.
+    # So here we remember the size of every (font, text) pair we've measured.  One of these can be shared by all the
+    # trees drawn with the same fonts.
+
+    max_edge_key_number = 20
+
+    def __init__(self):
+        super().__init__()
+        # Measure with a drawing of our own so that it doesn't matter which image the text ends up on.
+        self.draw = ImageDraw.Draw(Image.new('L', (1, 1)))
+        self.text_size_map = {}
+        self.edge_key_size_map_map = {}
+
+    def measure(self, font, text):
+        if hasattr(self.draw, 'textsize'):
+            return self.draw.textsize(text=text, font=font)
+        # Newer versions of Pillow only give us the bounding box of the text.
+        box = self.draw.multiline_textbbox((0, 0), text, font=font)
+        return box[2] - box[0], box[3] - box[1]
+
+    def text_size(self, font, text):
+        key = (font, text)
+        text_size = self.text_size_map.get(key)
+        if text_size is None:
+            text_size = self.measure(font, text)
+            self.text_size_map[key] = text_size
+        return text_size
+
+    def edge_key_size(self, font, key):
+        # There are only so many edge keys, so they're all measured up front the first time a font is used for them.
+        edge_key_size_map = self.edge_key_size_map_map.get(font)
+        if edge_key_size_map is None:
+            edge_key_list = ['Mother', 'Father']
+            for i in range(self.max_edge_key_number):
+                edge_key_list += ['Child %d' % (i + 1), 'Spouse %d' % (i + 1)]
+            edge_key_size_map = {edge_key: self.measure(font, edge_key) for edge_key in edge_key_list}
+            self.edge_key_size_map_map[font] = edge_key_size_map
+        text_size = edge_key_size_map.get(key)
+        if text_size is None:
+            text_size = self.text_size(font, key)
+        return text_size
+
+def pixel_point(x, y, origin):
+    # Round the given layout coordinates to a whole pixel of an image whose upper-left corner is at the given origin.
+    return math.floor(x + 0.5) - origin[0], math.floor(y + 0.5) - origin[1]
 
 class RenderNode(object):
     def __init__(self, person):
         super().__init__()
         self.person = person
         self.sub_node_map = {}
-        self.label_string = person.name + '\n' + person.family_search_id
+        self.label_string = person.name + '\n' + person.family_search_id if person is not None else ''
         self.label_box = AxisAlignedRectangle()
         self.bounding_box = None
+        # These decide how the label box is drawn.  See mark_highlighted and detach.
+        self.highlighted = False
+        self.proxy_work_available = person.any_proxy_work_available if person is not None else False
+
+    def mark_highlighted(self, person_set):
+        for node in self.all_nodes():
+            node.highlighted = node.person in person_set
+
+    def detach(self):
+        # Return a flat list of everything needed to lay out and draw the tree, without any reference to the persons,
+        # so that it can be cheaply sent to another process, where attach will turn it back into a tree.
+        # Each entry is (parent entry number, key, label string, highlighted, proxy work available.)
+        node_list = []
+        queue = [(-1, None, self)]
+        while len(queue) > 0:
+            parent_number, key, node = queue.pop()
+            node_list.append((parent_number, key, node.label_string, node.highlighted, node.proxy_work_available))
+            number = len(node_list) - 1
+            # Push in reverse so that sub-nodes come back out in the order of the sub-node map.
+            for sub_key in reversed(list(node.sub_node_map)):
+                queue.append((number, sub_key, node.sub_node_map[sub_key]))
+        return node_list
+
+    @staticmethod
+    def attach(node_list):
+        render_node_list = []
+        for parent_number, key, label_string, highlighted, proxy_work_available in node_list:
+            node = RenderNode(person=None)
+            node.label_string = label_string
+            node.highlighted = highlighted
+            node.proxy_work_available = proxy_work_available
+            if parent_number >= 0:
+                render_node_list[parent_number].sub_node_map[key] = node
+            render_node_list.append(node)
+        return render_node_list[0]
 
     def calculate_size(self):
         size = 0
@@ -19,69 +106,200 @@ class RenderNode(object):
             size += 1
         return size
 
-    def render_graph(self, draw, image, font, person_subset):
-        image_rect = AxisAlignedRectangle(Vector(0.0, 0.0), Vector(float(image.width), float(image.height)))
-        world_rect = self.bounding_box.Copy()
-        world_rect.ExpandToMatchAspectRatioOf(image_rect)
+    def calculate_image_size(self, padding=8.0):
+        width = math.ceil(self.bounding_box.max_point.x + padding) - math.floor(self.bounding_box.min_point.x - padding)
+        height = math.ceil(self.bounding_box.max_point.y + padding) - math.floor(self.bounding_box.min_point.y - padding)
+        return width, height
+
+    def render_graph(self, font, text_metrics, tile_size, padding=8.0):
+        # Draw the laid-out tree at one pixel per unit of layout, which is how the text was measured, so that the
+        # labels stay readable however big the tree gets.  Big trees are drawn in tiles of at most the given size a
+        # side, and only one tile is ever held in memory; this generator yields (row, column, image) for each one.
+        # Tiles with nothing on them are skipped.  Each node is filed under all the tiles that its label box, its
+        # edges or their labels reach into, so that a tile only draws the nodes it needs to.
+        min_x = math.floor(self.bounding_box.min_point.x - padding)
+        min_y = math.floor(self.bounding_box.min_point.y - padding)
+        width, height = self.calculate_image_size(padding)
+        row_count = (height + tile_size - 1) // tile_size
+        column_count = (width + tile_size - 1) // tile_size
+
+        tile_node_list_map = {}
+        for node in self.all_nodes():
+            extent = node.calculate_render_extent(font, text_metrics)
+            first_column = max(int((extent[0] - min_x) // tile_size), 0)
+            first_row = max(int((extent[1] - min_y) // tile_size), 0)
+            last_column = min(int((extent[2] - min_x) // tile_size), column_count - 1)
+            last_row = min(int((extent[3] - min_y) // tile_size), row_count - 1)
+            for row in range(first_row, last_row + 1):
+                for column in range(first_column, last_column + 1):
+                    tile_node_list_map.setdefault((row, column), []).append(node)
+
+        for row in range(row_count):
+            for column in range(column_count):
+                node_list = tile_node_list_map.get((row, column))
+                if node_list is None:
+                    continue
+                tile_width = min(tile_size, width - column * tile_size)
+                tile_height = min(tile_size, height - row * tile_size)
+                image = Image.new('RGBA', (tile_width, tile_height), (255, 255, 255, 0))
+                draw = ImageDraw.Draw(image)
+                origin = (min_x + column * tile_size, min_y + row * tile_size)
+                for node in node_list:
+                    node.render_edges(draw, font, origin, text_metrics)
+                for node in node_list:
+                    node.render_label_box(draw, font, origin, text_metrics)
+                yield row, column, image
+
+    def render_svg(self, handle, font, text_metrics, padding=8.0):
+        # Write the laid-out tree to the given text stream as an SVG document, at the same scale and in the same colors
+        # as render_graph, but node by node as we go, so nothing but the tree itself is ever held in memory.  The widths
+        # of the text are the ones the layout was done with, so that labels fit their boxes whatever font the viewer uses.
+        min_x = math.floor(self.bounding_box.min_point.x - padding)
+        min_y = math.floor(self.bounding_box.min_point.y - padding)
+        width, height = self.calculate_image_size(padding)
+        handle.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        handle.write('<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" viewBox="%d %d %d %d" font-family="JetBrains Mono, monospace" font-size="%d">\n' % (
+            width, height, min_x, min_y, width, height, font.size))
+        handle.write('<g stroke="rgb(50,100,100)" stroke-width="1">\n')
+        for node in self.all_nodes():
+            node.render_svg_edges(handle)
+        handle.write('</g>\n<g text-anchor="middle" dominant-baseline="central" fill="rgb(0,0,0)">\n')
         for node in self.all_nodes():
-            node.render_edges(draw, font, image_rect, world_rect)
+            node.render_svg_edge_labels(handle, font, text_metrics)
+        handle.write('</g>\n<g stroke="rgb(255,0,0)" stroke-width="1">\n')
         for node in self.all_nodes():
-            node.render_label_box(draw, font, image_rect, world_rect, person_subset)
+            node.render_svg_label_box(handle, font, text_metrics)
+        handle.write('</g>\n</svg>\n')
 
-    def render_edges(self, draw, font, image_rect, world_rect):
-        point_a = world_rect.Map(self.label_box.Center(), image_rect)
+    def render_svg_edges(self, handle):
+        point_a = self.label_box.Center()
         for key in self.sub_node_map:
-            sub_node = self.sub_node_map[key]
-            point_b = world_rect.Map(sub_node.label_box.Center(), image_rect)
-            draw.line((point_a.x, point_a.y, point_b.x, point_b.y), fill=(50, 100, 100), width=1)
-            point_c = (point_a + point_b) * 0.5
-            text_size = draw.textsize(text=key, font=font)
-            draw.text((point_c.x - text_size[0] / 2, point_c.y - text_size[1] / 2), text=key, font=font, fill=(0, 0, 0))
-
-    def render_label_box(self, draw, font, image_rect, world_rect, person_subset):
-        point_a = world_rect.Map(self.label_box.min_point, image_rect)
-        point_b = world_rect.Map(self.label_box.max_point, image_rect)
-        color = (80, 32, 32) if self.person in person_subset else (32, 32, 32)
-        if self.person.any_proxy_work_available:
-            color = (32, 80, 23)
-        draw.rectangle((point_a.x, point_a.y, point_b.x, point_b.y), fill=color)
-        polygon = self.label_box.GeneratePolygon()
-        for world_line in polygon.GenerateLineSegments():
-            image_line = world_rect.Map(world_line, image_rect)
-            draw.line((image_line.point_a.x, image_line.point_a.y, image_line.point_b.x, image_line.point_b.y), fill=(255, 0, 0), width=1)
-            point = world_rect.Map(self.label_box.Center(), image_rect)
-        text_size = draw.textsize(text=self.label_string, font=font)
-        draw.text((point.x - text_size[0] / 2, point.y - text_size[1] / 2), text=self.label_string, font=font, fill=(200, 200, 200))
+            point_b = self.sub_node_map[key].label_box.Center()
+            handle.write('<line x1="%g" y1="%g" x2="%g" y2="%g"/>\n' % (point_a.x, point_a.y, point_b.x, point_b.y))
 
-    def transform_graph_layout(self, transform):
-        for node in self.all_nodes():
-            node.label_box = transform.Transform(node.label_box)
-            node.bounding_box = transform.Transform(node.bounding_box)
+    def render_svg_edge_labels(self, handle, font, text_metrics):
+        point_a = self.label_box.Center()
+        for key in self.sub_node_map:
+            point_c = (point_a + self.sub_node_map[key].label_box.Center()) * 0.5
+            text_size = text_metrics.edge_key_size(font, key)
+            handle.write('<text x="%g" y="%g" textLength="%d">%s</text>\n' % (point_c.x, point_c.y, text_size[0], escape(key)))
 
-    def calculate_graph_layout(self, draw, font):
-        text_size = draw.textsize(text=self.label_string, font=font)
-        text_width = text_size[0]
-        text_height = text_size[1]
+    def render_svg_label_box(self, handle, font, text_metrics):
+        color = (80, 32, 32) if self.highlighted else (32, 32, 32)
+        if self.proxy_work_available:
+            color = (32, 80, 23)
+        handle.write('<rect x="%g" y="%g" width="%g" height="%g" fill="rgb(%d,%d,%d)"/>\n' % (
+            self.label_box.min_point.x, self.label_box.min_point.y, self.label_box.Width(), self.label_box.Height(), *color))
+        point = self.label_box.Center()
+        line_list = self.label_string.split('\n')
+        line_height = text_metrics.text_size(font, self.label_string)[1] / len(line_list)
+        handle.write('<text text-anchor="middle" dominant-baseline="central" fill="rgb(200,200,200)" stroke="none">')
+        for i, line in enumerate(line_list):
+            y = point.y + (i - (len(line_list) - 1) / 2.0) * line_height
+            handle.write('<tspan x="%g" y="%g" textLength="%d">%s</tspan>' % (point.x, y, text_metrics.text_size(font, line)[0], escape(line)))
+        handle.write('</text>\n')
 
-        total_width = 0.0
-        margin = 2.0
+    def calculate_render_extent(self, font, text_metrics):
+        # Return (min_x, min_y, max_x, max_y) of everything render_edges and render_label_box draw for this node.
+        min_x = self.label_box.min_point.x
+        min_y = self.label_box.min_point.y
+        max_x = self.label_box.max_point.x
+        max_y = self.label_box.max_point.y
+        center_x = (min_x + max_x) / 2.0
+        center_y = (min_y + max_y) / 2.0
         for key in self.sub_node_map:
             sub_node = self.sub_node_map[key]
-            sub_node.calculate_graph_layout(draw, font)
-            sub_node.calculate_bounding_box()
-            total_width += sub_node.bounding_box.Width() + 2.0 * margin
+            sub_center_x = (sub_node.label_box.min_point.x + sub_node.label_box.max_point.x) / 2.0
+            sub_center_y = (sub_node.label_box.min_point.y + sub_node.label_box.max_point.y) / 2.0
+            text_size = text_metrics.edge_key_size(font, key)
+            half_width = text_size[0] / 2.0 + 1.0
+            half_height = text_size[1] / 2.0 + 1.0
+            mid_x = (center_x + sub_center_x) / 2.0
+            mid_y = (center_y + sub_center_y) / 2.0
+            min_x = min(min_x, sub_center_x, mid_x - half_width)
+            min_y = min(min_y, sub_center_y, mid_y - half_height)
+            max_x = max(max_x, sub_center_x, mid_x + half_width)
+            max_y = max(max_y, sub_center_y, mid_y + half_height)
+        return min_x - 1.0, min_y - 1.0, max_x + 1.0, max_y + 1.0
+
+    # Everything is drawn at whole-pixel coordinates, rounded in layout space before being moved to the tile, so that
+    # a tree drawn as tiles comes out exactly the same as it would have in one image.
 
-        location = Vector(-total_width / 2.0 + margin, -2.0 * text_height)
+    def render_edges(self, draw, font, origin, text_metrics):
+        point_a = self.label_box.Center()
         for key in self.sub_node_map:
             sub_node = self.sub_node_map[key]
-            transform = AffineTransform()
-            upper_left_corner = Vector(sub_node.bounding_box.min_point.x, sub_node.bounding_box.max_point.y)
-            transform.Translation(location - upper_left_corner)
-            sub_node.transform_graph_layout(transform)
-            location.x += sub_node.bounding_box.Width() + 2.0 * margin
+            point_b = sub_node.label_box.Center()
+            draw.line(pixel_point(point_a.x, point_a.y, origin) + pixel_point(point_b.x, point_b.y, origin), fill=(50, 100, 100), width=1)
+            point_c = (point_a + point_b) * 0.5
+            text_size = text_metrics.edge_key_size(font, key)
+            draw.text(pixel_point(point_c.x - text_size[0] / 2, point_c.y - text_size[1] / 2, origin), text=key, font=font, fill=(0, 0, 0))
+
+    def render_label_box(self, draw, font, origin, text_metrics):
+        point_a = self.label_box.min_point
+        point_b = self.label_box.max_point
+        color = (80, 32, 32) if self.highlighted else (32, 32, 32)
+        if self.proxy_work_available:
+            color = (32, 80, 23)
+        draw.rectangle(pixel_point(point_a.x, point_a.y, origin) + pixel_point(point_b.x, point_b.y, origin), fill=color)
+        polygon = self.label_box.GeneratePolygon()
+        for world_line in polygon.GenerateLineSegments():
+            draw.line(pixel_point(world_line.point_a.x, world_line.point_a.y, origin) + pixel_point(world_line.point_b.x, world_line.point_b.y, origin), fill=(255, 0, 0), width=1)
+        point = self.label_box.Center()
+        text_size = text_metrics.text_size(font, self.label_string)
+        draw.text(pixel_point(point.x - text_size[0] / 2, point.y - text_size[1] / 2, origin), text=self.label_string, font=font, fill=(200, 200, 200))
+
+    def calculate_graph_layout(self, font, text_metrics):
+        # Children are placed in a row beneath their parent, left to right, with each child's subtree boxed
+        # in by its bounding box and the boxes spaced apart by a margin, the whole row centered on the parent.
+        # This is done in time linear in the size of the tree.  Going bottom-up, each node's subtree extent is
+        # found relative to the node itself, along with each child's offset from its parent.  Going top-down,
+        # the offsets are then accumulated into the final positions.
+        margin = 2.0
+        node_list = list(self.all_nodes())
+        label_map = {}
+        extent_map = {}
+        offset_map = {}
+        for node in reversed(node_list):
+            text_size = text_metrics.text_size(font, node.label_string)
+            text_width = text_size[0]
+            text_height = text_size[1]
+            label = (-text_width / 2.0 - 3.0, -text_height / 2.0 - 3.0, text_width / 2.0 + 3.0, text_height / 2.0 + 3.0)
+            label_map[id(node)] = label
+
+            total_width = 0.0
+            for key in node.sub_node_map:
+                extent = extent_map[id(node.sub_node_map[key])]
+                total_width += extent[2] - extent[0] + 2.0 * margin
+
+            min_x, min_y, max_x, max_y = label
+            x = -total_width / 2.0 + margin
+            y = -2.0 * text_height
+            for key in node.sub_node_map:
+                sub_node = node.sub_node_map[key]
+                extent = extent_map[id(sub_node)]
+                # Put the upper-left corner of the sub-node's bounding box at the current location.
+                dx = x - extent[0]
+                dy = y - extent[3]
+                offset_map[id(sub_node)] = (dx, dy)
+                min_x = min(min_x, extent[0] + dx)
+                min_y = min(min_y, extent[1] + dy)
+                max_x = max(max_x, extent[2] + dx)
+                max_y = max(max_y, extent[3] + dy)
+                x += extent[2] - extent[0] + 2.0 * margin
+            extent_map[id(node)] = (min_x, min_y, max_x, max_y)
 
-        self.label_box.min_point = Vector(-text_width / 2.0 - 3.0, -text_height / 2.0 - 3.0)
-        self.label_box.max_point = Vector(text_width / 2.0 + 3.0, text_height / 2.0 + 3.0)
+        position_map = {id(self): (0.0, 0.0)}
+        for node in node_list:
+            x, y = position_map[id(node)]
+            for key in node.sub_node_map:
+                sub_node = node.sub_node_map[key]
+                dx, dy = offset_map[id(sub_node)]
+                position_map[id(sub_node)] = (x + dx, y + dy)
+            label = label_map[id(node)]
+            extent = extent_map[id(node)]
+            node.label_box = AxisAlignedRectangle(Vector(label[0] + x, label[1] + y), Vector(label[2] + x, label[3] + y))
+            node.bounding_box = AxisAlignedRectangle(Vector(extent[0] + x, extent[1] + y), Vector(extent[2] + x, extent[3] + y))
 
     def calculate_bounding_box(self):
         self.bounding_box = self.label_box.Copy()
@@ -98,25 +316,40 @@ class RenderNode(object):
                 queue.append(sub_node)
 
     def prune_tree(self, person_set):
-        del_key_list = []
-        for key in self.sub_node_map:
-            sub_node = self.sub_node_map[key]
-            if not sub_node.any_person_found_in(person_set):
-                del_key_list.append(key)
-        for key in del_key_list:
-            del self.sub_node_map[key]
-        for key in self.sub_node_map:
-            sub_node = self.sub_node_map[key]
-            sub_node.prune_tree(person_set)
+        # Cut away every branch without anyone from the given set in it.  Going through the nodes bottom-up,
+        # each node's branches have already been pruned by the time we get to it, so a node has someone from
+        # the set in its subtree exactly when it's one of them itself or has any branches left.
+        found_set = set()
+        for node in reversed(list(self.all_nodes())):
+            node.sub_node_map = {key: sub_node for key, sub_node in node.sub_node_map.items() if id(sub_node) in found_set}
+            if node.person in person_set or len(node.sub_node_map) > 0:
+                found_set.add(id(node))
 
     def any_person_found_in(self, person_set):
         for node in self.all_nodes():
             if node.person in person_set:
                 return True
 
-    # TODO: Write an optimizer for the tree.  E.g., your father's spouse's son is just your brother.
-    #       Note that some people can't be removed from the tree if they fall within a given set.
-    #       I.e., the set of people we want to see in the tree.
+    def construct_using_kinship_paths(self, path_list, person_set):
+        # Like construct_using_path, but with one edge per named relationship (see kinship.py) rather than one per
+        # step, so that, e.g., your father's spouse's son is just your half-brother.  Persons along the way only get
+        # a node of their own where one named relationship ends and the next begins, or if they're in the given set.
+        # Paths that start out the same way share nodes for as long as they do.
+        node_map = {}
+        for path in path_list:
+            node = self
+            for name, person in kinship_hops(self.person, path, person_set):
+                sub_node = node_map.get((id(node), person))
+                if sub_node is None:
+                    key = name[0].upper() + name[1:]
+                    i = 1
+                    while key in node.sub_node_map:
+                        i += 1
+                        key = '%s %d' % (name[0].upper() + name[1:], i)
+                    sub_node = RenderNode(person=person)
+                    node.sub_node_map[key] = sub_node
+                    node_map[(id(node), person)] = sub_node
+                node = sub_node
 
     def construct_using_path(self, path, i=0):
         if i < len(path):
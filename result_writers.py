@@ -0,0 +1,86 @@
+# result_writers.py
+
+import os
+import csv
+
+class ResultWriter(object):
+    # Writes search results out one row at a time, as they're found, with one row per search group and person.
+    # No render tree is built, so there's no reason to cap the number of results as there is for the image files.
+
+    buffer_size = 1024 * 1024
+
+    def __init__(self, out_file):
+        super().__init__()
+        self.out_file = out_file
+        self.row_count = 0
+        self.last_relationship = None
+        self.last_column_list = None
+        self.handle = open(out_file, 'w', encoding='utf-8', newline=self.newline(), buffering=self.buffer_size)
+        self.write_header()
+
+    def newline(self):
+        return None
+
+    def write_header(self):
+        pass
+
+    def write_result(self, search_group, relationship):
+        self.write_row(self.make_row(search_group, relationship))
+        self.row_count += 1
+
+    def write_row(self, row):
+        raise Exception('Pure virtual call.')
+
+    def make_row(self, search_group, relationship):
+        # A person matching several search groups is written out once for each of them, one right after the other,
+        # so the rest of the row is kept from the last time rather than naming the relationship all over again.
+        if relationship is not self.last_relationship:
+            person = relationship.person
+            self.last_relationship = relationship
+            self.last_column_list = [
+                person.family_search_id or '',
+                person.name,
+                format_date(person.birthday),
+                format_date(person.deathday),
+                str(relationship),
+                str(relationship.length),
+                format_path(relationship.path)
+            ]
+        return [search_group.ordinance_name] + self.last_column_list
+
+    def close(self):
+        self.handle.close()
+
+class TextResultWriter(ResultWriter):
+    def write_row(self, row):
+        ordinance_name, family_search_id, name, birthday, deathday, relationship, length, path = row
+        self.handle.write('%s needed: "%s" (%s), born %s, died %s; %s (distance %s: %s)\n' % (
+            ordinance_name, name, family_search_id or '?', birthday or '?', deathday or '?', relationship, length, path or 'self'))
+
+class CsvResultWriter(ResultWriter):
+    def newline(self):
+        # The csv module writes its own line endings.
+        return ''
+
+    def write_header(self):
+        self.csv_writer = csv.writer(self.handle)
+        self.csv_writer.writerow(['Ordinance', 'Family Search ID', 'Name', 'Birth Date', 'Death Date', 'Relationship', 'Distance', 'Path'])
+
+    def write_row(self, row):
+        self.csv_writer.writerow(row)
+
+def create_result_writer(out_file):
+    # Return a writer for the given file if it's of a kind that results can be streamed to, otherwise None.
+    ext = os.path.splitext(out_file)[1]
+    if ext == '.txt':
+        return TextResultWriter(out_file)
+    if ext == '.csv':
+        return CsvResultWriter(out_file)
+    return None
+
+def format_date(date):
+    return date.date().isoformat() if date is not None else ''
+
+def format_path(path):
+    # E.g., "father, mother, child 2", where spouses and children are numbered from one.
+    return ', '.join([edge if edge in ('mother', 'father') else '%s %d' % (edge, index + 1) for edge, index in path])
@@ -0,0 +1,75 @@
+# scrape_cache.py
+
+import os
+import json
+import time
+import sqlite3
+
+class ScrapeCache(object):
+    # What we've scraped from FamilySearch.org, kept in an SQLite database so that each person is committed to disk
+    # as soon as they're scraped, and so that looking someone up doesn't mean reading in everything else.  It acts
+    # like the dictionary from family search ID to ordinance info that used to be kept in a JSON file, but also
+    # remembers when each person was scraped, so that stale info can be refreshed.
+
+    def __init__(self, cache_file):
+        super().__init__()
+        self.cache_file = cache_file
+        new_file = not os.path.exists(cache_file)
+        self.connection = sqlite3.connect(cache_file)
+        # With write-ahead logging, a crash can lose at most the person being written.
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS scrape_cache (family_search_id TEXT PRIMARY KEY, info TEXT NOT NULL, scrape_time REAL NOT NULL)')
+        self.connection.commit()
+        if new_file:
+            # Bring over whatever was scraped into the JSON file of old, if there is one.
+            json_file = os.path.splitext(cache_file)[0] + '.json'
+            if os.path.exists(json_file):
+                self.import_json(json_file)
+
+    def import_json(self, json_file):
+        with open(json_file, 'r') as handle:
+            scrape_cache = json.loads(handle.read())
+        # We don't know when these were scraped, but it can't have been after the file was last written.
+        scrape_time = os.path.getmtime(json_file)
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO scrape_cache VALUES (?, ?, ?)',
+                [(family_search_id, json.dumps(info), scrape_time) for family_search_id, info in scrape_cache.items()])
+        print('Imported %d people from legacy scrape cache file %s.' % (len(scrape_cache), json_file))
+
+    def close(self):
+        self.connection.close()
+
+    def get(self, family_search_id, default=None):
+        row = self.connection.execute('SELECT info FROM scrape_cache WHERE family_search_id = ?', (family_search_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else default
+
+    def __getitem__(self, family_search_id):
+        info = self.get(family_search_id)
+        if info is None:
+            raise KeyError(family_search_id)
+        return info
+
+    def __setitem__(self, family_search_id, info):
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO scrape_cache VALUES (?, ?, ?)', (family_search_id, json.dumps(info), time.time()))
+
+    def __contains__(self, family_search_id):
+        return self.connection.execute('SELECT 1 FROM scrape_cache WHERE family_search_id = ?', (family_search_id,)).fetchone() is not None
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM scrape_cache').fetchone()[0]
+
+    def scrape_time(self, family_search_id):
+        # Return when the given person was last scraped, in seconds since the epoch, or None if they never were.
+        row = self.connection.execute('SELECT scrape_time FROM scrape_cache WHERE family_search_id = ?', (family_search_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def is_fresh(self, family_search_id, max_age, empty_max_age=None):
+        # Tell whether the given person was scraped no more than the given number of seconds ago, or, if no ordinances
+        # at all were found for them and an empty max age is given, no more than the lesser of the two ago.
+        row = self.connection.execute('SELECT info, scrape_time FROM scrape_cache WHERE family_search_id = ?', (family_search_id,)).fetchone()
+        if row is None:
+            return False
+        if empty_max_age is not None and len(json.loads(row[0])) == 0:
+            max_age = min(max_age, empty_max_age)
+        return time.time() - row[1] <= max_age
@@ -0,0 +1,118 @@
+# scrape_stand_in.py
+
+import os
+import re
+import sys
+import json
+import argparse
+import threading
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from web_scraper import WebScraper
+
+# A local stand-in for the pages of FamilySearch.org that the web scraper reads, serving the canned pages in the
+# stand_in_pages directory: a sign-in page, and an ordinances page per person, filled in from ordinances.json,
+# where a person's ordinances can also be null, for a page that never finishes loading.  Anyone not in there gets
+# an ordinances page with an empty table.  Point the analyzer at it with --scrapeURL and --loginURL, or have this
+# script run the web scraper against it with --scrape.
+
+pages_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stand_in_pages')
+
+class StandInRequestHandler(BaseHTTPRequestHandler):
+    ordinances_path_regex = re.compile(r'^/tree/person/ordinances/([^/?#]+)')
+
+    def do_GET(self):
+        match = self.ordinances_path_regex.match(self.path)
+        if match is not None:
+            ordinance_list = self.server.ordinance_map.get(match.group(1), [])
+            with open(os.path.join(pages_dir, 'ordinances.html'), 'r', encoding='utf-8') as handle:
+                page = handle.read().replace('__ORDINANCE_LIST__', json.dumps(ordinance_list))
+        elif self.path == '/' or self.path.startswith('/en/'):
+            with open(os.path.join(pages_dir, 'login.html'), 'r', encoding='utf-8') as handle:
+                page = handle.read()
+        else:
+            self.send_error(404)
+            return
+        content = page.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+def create_stand_in_server(port):
+    server = ThreadingHTTPServer(('127.0.0.1', port), StandInRequestHandler)
+    with open(os.path.join(pages_dir, 'ordinances.json'), 'r', encoding='utf-8') as handle:
+        server.ordinance_map = json.load(handle)
+    return server
+
+def check_web_scraper(web_scraper, ordinance_map):
+    # Scrape everyone in the canned data, plus someone who isn't in it, and return the number of persons for whom
+    # the scraper didn't find exactly what their pages show.  A page that never finishes loading must fail to be
+    # scraped, rather than be taken for a page without ordinances.
+    expected_info_map = {family_search_id: dict(ordinance_list) if ordinance_list is not None else None for family_search_id, ordinance_list in ordinance_map.items()}
+    expected_info_map['NOT-CANNED'] = {}
+    failure_count = 0
+    for family_search_id, info in web_scraper.scrape(list(expected_info_map)):
+        if info != expected_info_map[family_search_id]:
+            print('FAILED %s: expected %s, but scraped %s' % (family_search_id, expected_info_map[family_search_id], info))
+            failure_count += 1
+        else:
+            print('Passed %s: %s' % (family_search_id, info))
+    return failure_count
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve canned FamilySearch.org pages locally, for trying out the web scraper.')
+    parser.add_argument('--port', dest='port', help='Port to serve on; defaults to 8765, and 0 picks any free port.', type=int, default=8765)
+    parser.add_argument('--scrape', dest='scrape_id_list', help='Rather than serve until stopped, scrape these comma-separated family search IDs from the stand-in, print what was found, and quit.')
+    parser.add_argument('--check', dest='check', help='Rather than serve until stopped, scrape everyone in the canned data from the stand-in and check that exactly what their pages show was found; the exit status is 1 if not.', action='store_true')
+    parser.add_argument('--username', dest='username', help='Sign in with this username (any will do) before scraping.')
+
+    args = parser.parse_args()
+
+    server = create_stand_in_server(args.port)
+    base_url = 'http://127.0.0.1:%d' % server.server_address[1]
+
+    if args.scrape_id_list is None and not args.check:
+        print('Serving stand-in pages; scrape them with:')
+        print('  --scrapeURL %s/tree/person/ordinances/%%s --loginURL %s/en/' % (base_url, base_url))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        server.server_close()
+        sys.exit(0)
+
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+
+    web_scraper = WebScraper()
+    web_scraper.ordinances_url = base_url + '/tree/person/ordinances/%s'
+    web_scraper.login_url = base_url + '/en/'
+    web_scraper.username = args.username
+    web_scraper.password = ''
+    web_scraper.requests_per_second = 10.0
+    exit_status = 0
+    try:
+        if args.check:
+            # Pages that never finish loading only need to be waited on long enough to outlast the loading indicator.
+            web_scraper.page_timeout = 3.0
+            web_scraper.max_retries = 0
+            failure_count = check_web_scraper(web_scraper, server.ordinance_map)
+            if failure_count > 0:
+                print('%d of %d checks failed.' % (failure_count, len(server.ordinance_map) + 1))
+                exit_status = 1
+            else:
+                print('All checks passed.')
+        else:
+            family_search_id_list = [family_search_id.strip() for family_search_id in args.scrape_id_list.split(',') if len(family_search_id.strip()) > 0]
+            for family_search_id, info in web_scraper.scrape(family_search_id_list):
+                print('%s: %s' % (family_search_id, info))
+    finally:
+        web_scraper.close()
+        server.shutdown()
+        server.server_close()
+    sys.exit(exit_status)
@@ -1,45 +1,71 @@
 # search_results.py
 
 import os
+import heapq
 
-from PIL import Image, ImageDraw, ImageFont
-from render_tree import RenderNode
+from concurrent.futures import ProcessPoolExecutor
+from itertools import compress
+from PIL import ImageFont
+from render_tree import RenderNode, TextMetrics
+from result_writers import TextResultWriter, CsvResultWriter
 
 class SearchGroup(object):
     def __init__(self):
         super().__init__()
         self.relationship_list = []
+        self.match_mask = None
+        self.ordinance_name = None
+        self.result_count = 0       # Results written out as they're found aren't kept in the list, only counted.
+        self.candidate_heap = []    # See SearchResults.offer_candidate.
+        self.ready_count = 0
 
     def is_match(self, relationship):
         raise Exception('Pure virtual call.')
 
+    def calc_match_mask(self, graph):
+        # Do what is_match does, but for everyone in the given graph at once.  See FamilyTreeGraph.
+        raise Exception('Pure virtual call.')
+
 class BaptismNeededGroup(SearchGroup):
     def __init__(self):
         super().__init__()
+        self.ordinance_name = 'Baptism'
 
     def is_match(self, relationship):
         person = relationship.person
         return person.baptism_date is None and not person.died_before_eight
 
+    def calc_match_mask(self, graph):
+        return graph.invert_mask(graph.date_known_mask('baptism_date') | graph.flag_set_mask('died_before_eight'))
+
 class EndownmentNeededGroup(SearchGroup):
     def __init__(self):
         super().__init__()
+        self.ordinance_name = 'Endowment'
 
     def is_match(self, relationship):
         person = relationship.person
         return person.endownment_date is None
 
+    def calc_match_mask(self, graph):
+        return graph.invert_mask(graph.date_known_mask('endownment_date'))
+
 class SealingToParentsNeededGroup(SearchGroup):
     def __init__(self):
         super().__init__()
+        self.ordinance_name = 'Sealing to parents'
 
     def is_match(self, relationship):
         person = relationship.person
         return person.sealing_to_parents_date is None and not person.born_in_the_covenant
 
+    def calc_match_mask(self, graph):
+        return graph.invert_mask(graph.date_known_mask('sealing_to_parents_date') | graph.flag_set_mask('born_in_the_covenant'))
+
 class SealingToSpouseNeededGroup(SearchGroup):
     def __init__(self):
         super().__init__()
+        self.ordinance_name = 'Sealing to spouse'
 
     def is_match(self, relationship):
         person = relationship.person
@@ -53,6 +79,10 @@ class SealingToSpouseNeededGroup(SearchGroup):
 
         return person.sealing_to_spouse_date is None
 
+    def calc_match_mask(self, graph):
+        died_too_young_mask = graph.life_span_under_mask(365 * 13) & graph.invert_mask(graph.had_any_children_mask())
+        return graph.invert_mask(graph.date_known_mask('sealing_to_spouse_date') | died_too_young_mask)
+
 class SearchResults(object):
     def __init__(self):
         super().__init__()
@@ -62,45 +92,201 @@ class SearchResults(object):
             SealingToParentsNeededGroup(),
             SealingToSpouseNeededGroup()
         ]
-        self.max_results = 15
+        self.max_results = 15     # Most results per search group; -1 means no limit.
+        self.tile_size = 4096
+        # Search groups are rendered in this many processes; None means as many as there are CPUs, up to one per group.
+        self.render_jobs = None
+        self.png_compress_level = 6
+        # If set, result trees have an edge per named relationship (e.g., "First cousin") rather than per step.
+        self.kinship_paths = False
+        # Persons scraped no more than this many seconds ago aren't scraped again; -1 means always scrape them.
+        self.scrape_max_age = 7 * 24 * 60 * 60
+        # Persons with no ordinances at all are scraped again sooner, since that's more likely a page gone wrong.
+        self.scrape_empty_max_age = 24 * 60 * 60
+        # Stop scraping once this many persons are known to have ordinance work available; -1 means never stop early.
+        self.scrape_stop_after_ready = -1
+        # If set, each result is handed to this as soon as it's accumulated, rather than kept; see result_writers.py.
+        self.result_writer = None
+        # Which results to keep when there are more than the maximum: 'distance' keeps the first ones found, which are
+        # the closest, and 'readiness' keeps those known to have ordinance work available first, then the closest.
+        self.rank_by = 'distance'
+        # Bit i is set while the i-th search group still wants results; None until accumulation begins.
+        self.open_group_mask = None
+        self.candidate_count = 0
+
+    def begin_accumulation(self):
+        # Call this once the settings above are final and before the first relationship is accumulated.
+        # Every group starts out open, unless no results are wanted at all.
+        self.open_group_mask = 0
+        self.candidate_count = 0
+        for i, search_group in enumerate(self.search_group_list):
+            search_group.relationship_list = []
+            search_group.result_count = 0
+            search_group.ready_count = 0
+            search_group.candidate_heap = []
+            if self.max_results != 0:
+                self.open_group_mask |= 1 << i
 
     def max_results_reached(self):
-        return all([len(search_group.relationship_list) >= self.max_results for search_group in self.search_group_list])
+        if self.open_group_mask is None:
+            raise Exception('Accumulation has not begun.')
+        return self.open_group_mask == 0
 
     def conditionally_accumulate(self, relationship):
-        if relationship.person.deathday is not None:
-            for search_group in self.search_group_list:
-                if search_group.is_match(relationship) and len(search_group.relationship_list) < self.max_results:
-                    search_group.relationship_list.append(relationship)
+        if self.open_group_mask is None:
+            raise Exception('Accumulation has not begun.')
+        if relationship.person.deathday is not None and self.open_group_mask != 0:
+            # A person matching several groups is offered to each of them in the same place in the order.
+            self.candidate_count += 1
+            for i, search_group in enumerate(self.search_group_list):
+                if not self.open_group_mask & (1 << i):
+                    continue
+                if search_group.match_mask is not None:
+                    is_match = search_group.match_mask[relationship.person.index] == 1
+                else:
+                    is_match = search_group.is_match(relationship)
+                if is_match:
+                    if self.rank_by == 'readiness':
+                        self.offer_candidate(search_group, relationship)
+                    else:
+                        search_group.result_count += 1
+                        if self.result_writer is not None:
+                            self.result_writer.write_result(search_group, relationship)
+                        else:
+                            search_group.relationship_list.append(relationship)
+                    # A group ranked by distance is done once it has the maximum number of results, since anyone
+                    # found later is further away; one ranked by readiness, once that many of them are known to be ready.
+                    if self.max_results != -1:
+                        count = search_group.ready_count if self.rank_by == 'readiness' else search_group.result_count
+                        if count >= self.max_results:
+                            self.open_group_mask &= ~(1 << i)
 
-    def web_scrape(self, driver, scrape_cache):
-        all_people = set()
+    def offer_candidate(self, search_group, relationship):
+        # Each group keeps its best candidates so far in a heap, worst on top, so that the worst can be dropped
+        # whenever there are too many.  Candidates rank by whether they're ready, then by the order they were found in.
+        ready = relationship.person.any_proxy_work_available
+        if ready:
+            search_group.ready_count += 1
+        heapq.heappush(search_group.candidate_heap, (0 if ready else -1, -self.candidate_count, relationship))
+        if self.max_results != -1 and len(search_group.candidate_heap) > self.max_results:
+            heapq.heappop(search_group.candidate_heap)
+
+    def finish_accumulation(self):
+        # Results ranked by readiness aren't known until the search is over, so only then are they put in order,
+        # best first, and written out.  They're written out person by person across all groups, the same as results
+        # ranked by distance, so that a person's rows come one right after the other.
+        if self.rank_by == 'readiness':
+            candidate_list = []
+            for i, search_group in enumerate(self.search_group_list):
+                search_group.relationship_list = [relationship for ready, order, relationship in sorted(search_group.candidate_heap, reverse=True)]
+                search_group.result_count = len(search_group.relationship_list)
+                candidate_list += [(-ready, -order, i, relationship) for ready, order, relationship in search_group.candidate_heap]
+                search_group.candidate_heap = []
+            if self.result_writer is not None:
+                candidate_list.sort(key=lambda candidate: candidate[:3])
+                for ready, order, i, relationship in candidate_list:
+                    self.result_writer.write_result(self.search_group_list[i], relationship)
+
+    def prepare_batch(self, graph):
+        # Evaluate every search group across the whole population up front, using the columns of the given graph,
+        # so that accumulating a relationship is just a look-up.  Only the deceased are of interest.
+        deceased_mask = graph.date_known_mask('deathday')
+        for search_group in self.search_group_list:
+            search_group.match_mask = graph.mask_to_bytes(search_group.calc_match_mask(graph) & deceased_mask)
+
+    def calc_batch_matches(self, graph, reachable_list=None):
+        # Return, for each search group, the indices of all persons matching it, optionally limited to those
+        # in the given list of reachable person indices (e.g., everyone a walker visited.)  There is no limit
+        # on the number of results here.
+        if reachable_list is not None:
+            reachable_bytes = bytearray(graph.size)
+            for i in reachable_list:
+                reachable_bytes[i] = 1
+            reachable_mask = graph.mask_from_bytes(reachable_bytes)
+        else:
+            reachable_mask = graph.full_mask()
+        deceased_mask = graph.date_known_mask('deathday')
+        match_list_list = []
         for search_group in self.search_group_list:
-            all_people = all_people.union({relationship.person for relationship in search_group.relationship_list})
-        total_people = len(all_people)
-        print('Total people in search results: %d' % total_people)
+            match_bytes = graph.mask_to_bytes(search_group.calc_match_mask(graph) & deceased_mask & reachable_mask)
+            match_list_list.append(list(compress(range(graph.size), match_bytes)))
+        return match_list_list
+
+    def plan_web_scrape(self, scrape_cache):
+        # Return the persons in the search results worth scraping, closest relatives first.  Persons already known to
+        # have ordinance work available are left out, as are those scraped no more than the maximum age ago.
+        distance_map = {}
+        for search_group in self.search_group_list:
+            for relationship in search_group.relationship_list:
+                person = relationship.person
+                if person not in distance_map or relationship.length < distance_map[person]:
+                    distance_map[person] = relationship.length
+        person_list = sorted(distance_map, key=lambda person: distance_map[person])
+        print('Total people in search results: %d' % len(person_list))
+        ready_count = len([person for person in person_list if person.any_proxy_work_available])
+        person_list = [person for person in person_list if not person.any_proxy_work_available]
+        if self.scrape_max_age != -1:
+            person_list = [person for person in person_list if not scrape_cache.is_fresh(person.family_search_id, self.scrape_max_age, self.scrape_empty_max_age)]
+        print('People already known to be ready: %d' % ready_count)
+        print('People needing to be scraped: %d' % len(person_list))
+        return person_list, ready_count
+
+    def web_scrape(self, web_scraper, scrape_cache):
+        # This is a bit insane and I'm not sure how ethical it is to thrash the website either.
+        # I'm not scraping every person in my family tree; just those in my search results.
+        # I want to know if ordinance work is already in progress or if it can be reserved.
+        person_list, ready_count = self.plan_web_scrape(scrape_cache)
+        if self.scrape_stop_after_ready != -1 and ready_count >= self.scrape_stop_after_ready:
+            print('Already know of enough people with ordinance work available.')
+            return
+        person_map = {person.family_search_id: person for person in person_list}
+        total_people = len(person_map)
         i = 0
-        for person in all_people:
+        for family_search_id, new_info in web_scraper.scrape([person.family_search_id for person in person_list]):
             i += 1
-            print('(%d/%d) Scraping additional info for: %s' % (i, total_people, person.name))
-            person.web_scrape(driver, scrape_cache)
+            if new_info is None:
+                continue
+            person = person_map[family_search_id]
+            print('(%d/%d) Scraped additional info for: %s' % (i, total_people, person.name))
+            info = scrape_cache.get(family_search_id, {})
+            info.update(new_info)
+            scrape_cache[family_search_id] = info
+            person.consume_scrape_cache(scrape_cache)
+            if person.any_proxy_work_available:
+                ready_count += 1
+                if self.scrape_stop_after_ready != -1 and ready_count >= self.scrape_stop_after_ready:
+                    print('Found enough people with ordinance work available; stopping early.')
+                    break
 
     def generate_text_file(self, out_file):
-        raise Exception('Not yet implimented')
+        self.write_results(TextResultWriter(out_file))
 
     def generate_csv_file(self, out_file):
-        raise Exception('Not yet implimented')
+        self.write_results(CsvResultWriter(out_file))
+
+    def write_results(self, result_writer):
+        # Write out everything accumulated so far, for when results weren't written out as they were accumulated.
+        try:
+            for search_group in self.search_group_list:
+                for relationship in search_group.relationship_list:
+                    result_writer.write_result(search_group, relationship)
+        finally:
+            result_writer.close()
 
     def generate_png_files(self, out_file, root_person, use_optimal_paths):
-        font = ImageFont.truetype('JetBrainsFonts/static/JetBrainsMono-Regular.ttf')
+        self.render_search_groups(out_file, root_person, use_optimal_paths, render_png_files, (self.tile_size, self.png_compress_level))
+
+    def generate_svg_files(self, out_file, root_person, use_optimal_paths):
+        self.render_search_groups(out_file, root_person, use_optimal_paths, render_svg_files, ())
 
+    def render_search_groups(self, out_file, root_person, use_optimal_paths, render_func, render_arg_tuple):
+        # Render trees are built here, where the persons are, but then detached from them so that each
+        # search group can be laid out and written out by the given function in a process of its own.
+        job_list = []
         for search_group in self.search_group_list:
             path, ext = os.path.splitext(out_file)
             image_file_path = path + '_' + search_group.__class__.__name__ + ext
 
-            image = Image.new('RGBA', (4096, 4096), (255, 255, 255, 0))
-            draw = ImageDraw.Draw(image)
-
             print('Generating render tree...')
 
             person_subset = {root_person}
@@ -111,8 +297,11 @@ class SearchResults(object):
                 # they were built using a breadth-first search of the family tree.
                 # This is an additive method.
                 root_node = RenderNode(person=root_person)
-                for relationship in search_group.relationship_list:
-                    root_node.construct_using_path(relationship.path)
+                if self.kinship_paths:
+                    root_node.construct_using_kinship_paths([relationship.path for relationship in search_group.relationship_list], person_subset)
+                else:
+                    for relationship in search_group.relationship_list:
+                        root_node.construct_using_path(relationship.path)
                 size = root_node.calculate_size()
                 print('Render tree size: %d' % size)
             else:
@@ -129,10 +318,62 @@ class SearchResults(object):
                 percentage = 100.0 * size_after / size_before
                 print('Tree reduced to %2.2f%% of its former size.' % percentage)
 
-            print('Calculating tree layout...')
-            root_node.calculate_graph_layout(draw, font)
-            root_node.calculate_bounding_box()
+            root_node.mark_highlighted(person_subset)
+            job_list.append((root_node.detach(), image_file_path) + render_arg_tuple)
+
+        render_jobs = self.render_jobs if self.render_jobs is not None else min(os.cpu_count() or 1, len(job_list))
+        if render_jobs <= 1:
+            for job in job_list:
+                render_func(*job)
+        else:
+            with ProcessPoolExecutor(max_workers=render_jobs) as executor:
+                future_list = [executor.submit(render_func, *job) for job in job_list]
+                for future in future_list:
+                    future.result()
+
+# The font and its text measurements are made once per process, the first time a tree is rendered, and shared by
+# every search group rendered in that process from then on, whether inline or in a worker of the pool.
+render_state = {}
+
+def get_font_and_text_metrics():
+    if 'font' not in render_state:
+        render_state['font'] = ImageFont.truetype('JetBrainsFonts/static/JetBrainsMono-Regular.ttf')
+        render_state['text_metrics'] = TextMetrics()
+    return render_state['font'], render_state['text_metrics']
+
+def render_png_files(node_list, image_file_path, tile_size, png_compress_level):
+    # Lay out, draw and encode one detached render tree (see RenderNode.detach.)  This may run in a process of its own.
+    font, text_metrics = get_font_and_text_metrics()
+    root_node = RenderNode.attach(node_list)
+
+    print('Calculating tree layout...')
+    root_node.calculate_graph_layout(font, text_metrics)
+    root_node.calculate_bounding_box()
+
+    path, ext = os.path.splitext(image_file_path)
+    width, height = root_node.calculate_image_size()
+    tiled = width > tile_size or height > tile_size
+    if tiled:
+        print('Rendering %d x %d tree to tiles of image file "%s"...' % (width, height, image_file_path))
+    else:
+        print('Rendering tree to image file "%s"...' % image_file_path)
+    for row, column, image in root_node.render_graph(font, text_metrics, tile_size):
+        if not tiled:
+            image.save(image_file_path, compress_level=png_compress_level)
+        else:
+            tile_file_path = path + '_%d_%d' % (row, column) + ext
+            print('Wrote tile "%s".' % tile_file_path)
+            image.save(tile_file_path, compress_level=png_compress_level)
+
+def render_svg_files(node_list, image_file_path):
+    # Lay out one detached render tree and write it out as a vector image.  This may run in a process of its own.
+    font, text_metrics = get_font_and_text_metrics()
+    root_node = RenderNode.attach(node_list)
+
+    print('Calculating tree layout...')
+    root_node.calculate_graph_layout(font, text_metrics)
+    root_node.calculate_bounding_box()
 
-            print('Rendering tree to image file "%s"...' % image_file_path)
-            root_node.render_graph(draw, image, font, person_subset)
-            image.save(image_file_path)
\ No newline at end of file
+    print('Writing tree to vector image file "%s"...' % image_file_path)
+    with open(image_file_path, 'w', encoding='utf-8') as handle:
+        root_node.render_svg(handle, font, text_metrics)
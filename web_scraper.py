@@ -0,0 +1,183 @@
+# web_scraper.py
+
+import os
+import time
+import queue
+import random
+import threading
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+class TokenBucket(object):
+    # Hands out at most the given number of tokens per second, with bursts of up to the given capacity.
+    # Every page load takes a token, so however many browser sessions are going, we never ask the website
+    # for more than we've decided is polite.
+
+    def __init__(self, rate, capacity=1.0):
+        super().__init__()
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_time) * self.rate)
+                self.last_time = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                wait_time = (1.0 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+class WebScraper(object):
+    # Scrape the ordinance status of persons from FamilySearch.org using a pool of browser sessions, one per thread.
+    # Rather than sleep a fixed amount on every page, we wait for the ordinance table to show up, and if it doesn't,
+    # try again later, backing off each time.  The URLs can be pointed at a local stand-in for the website.
+
+    # This digs the ordinance labels (e.g., "Baptism\nReady") out of the web components of the ordinances page,
+    # returning null until the table has been rendered.  A table without any rows only gives an empty list if it
+    # says outright that there's nothing to show; otherwise it may just be loading (e.g., showing a spinner.)
+    ordinance_script = '''
+        var element = document.querySelector("#main-content-section > fs-person-page");
+        if (!element || !element.shadowRoot) return null;
+        element = element.shadowRoot.querySelector("#pages > fs-tree-person-ordinance-list");
+        if (!element || !element.shadowRoot) return null;
+        element = element.shadowRoot.querySelector("fs-tree-person-ordinances");
+        if (!element || !element.shadowRoot) return null;
+        var row_element_list = element.shadowRoot.querySelectorAll(".ordinance-table-row");
+        if (row_element_list.length == 0) return element.shadowRoot.querySelector(".ordinance-table-empty") ? [] : null;
+        var text_list = [];
+        for (var i = 0; i < row_element_list.length; i++) {
+            var ordinance_element = row_element_list[i].querySelector("fs-tree-person-ordinance");
+            if (!ordinance_element || !ordinance_element.shadowRoot) return null;
+            var label_element = ordinance_element.shadowRoot.querySelector(".ordLabelText");
+            if (label_element) text_list.push(label_element.innerText);
+        }
+        return text_list;
+    '''
+
+    def __init__(self):
+        super().__init__()
+        self.username = None
+        self.password = None
+        self.login_url = 'https://www.familysearch.org/en/'
+        self.ordinances_url = 'https://www.familysearch.org/tree/person/ordinances/%s'
+        self.session_count = 2
+        self.requests_per_second = 0.5
+        self.page_timeout = 20.0
+        self.max_retries = 3
+        self.backoff_seconds = 2.0
+        self.driver_queue = queue.Queue()
+        self.driver_list = []
+        self.driver_list_lock = threading.Lock()
+        self.token_bucket = None
+
+    def create_driver(self):
+        # Add directory to path where web-driver executables can be found for Selenium.
+        # These are servers that act as the intermediary/abstraction-layer between our
+        # script (which uses the selenium API) and the actual browser.
+        web_drivers_dir = os.path.join(os.getcwd(), 'web_drivers')
+        path_list = os.environ['PATH'].split(os.pathsep)
+        if web_drivers_dir not in path_list:
+            path_list.append(web_drivers_dir)
+            os.environ['PATH'] = os.pathsep.join(path_list)
+
+        from selenium import webdriver
+        driver = webdriver.Chrome()
+        if self.username is not None:
+            self.login(driver)
+        return driver
+
+    def login(self, driver):
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        driver.get(self.login_url)
+        wait = WebDriverWait(driver, self.page_timeout)
+        wait.until(lambda driver: driver.find_element(By.XPATH, '//*[@id="signInLink"]')).click()
+        wait.until(lambda driver: driver.find_element(By.XPATH, '//*[@id="userName"]')).send_keys(self.username)
+        driver.find_element(By.XPATH, '//*[@id="password"]').send_keys(self.password)
+        driver.find_element(By.XPATH, '//*[@id="login"]').click()
+
+    def acquire_driver(self):
+        # Sessions are made as threads first need them and then passed around through the queue.
+        try:
+            return self.driver_queue.get_nowait()
+        except queue.Empty:
+            pass
+        driver = self.create_driver()
+        with self.driver_list_lock:
+            self.driver_list.append(driver)
+        return driver
+
+    def release_driver(self, driver):
+        self.driver_queue.put(driver)
+
+    def close(self):
+        for driver in self.driver_list:
+            driver.quit()
+        self.driver_list = []
+        self.driver_queue = queue.Queue()
+
+    def scrape_ordinances(self, driver, family_search_id):
+        # Return a map from ordinance name to status for the given person.
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        self.token_bucket.acquire()
+        driver.get(self.ordinances_url % family_search_id)
+        label_list = WebDriverWait(driver, self.page_timeout).until(lambda driver: self.read_ordinance_labels(driver))[0]
+        info = {}
+        for text in label_list:
+            text_list = text.split('\n')
+            if len(text_list) == 2:
+                ordinance = text_list[0]
+                status = text_list[1]
+                info[ordinance] = status
+        return info
+
+    def read_ordinance_labels(self, driver):
+        # The wait goes on for as long as this gives something false, which an empty list is, so the labels come
+        # wrapped in a tuple, or as None if the table hasn't been rendered yet.
+        label_list = driver.execute_script(self.ordinance_script)
+        return (label_list,) if label_list is not None else None
+
+    def scrape_person(self, family_search_id):
+        driver = self.acquire_driver()
+        try:
+            retry = 0
+            while True:
+                try:
+                    return self.scrape_ordinances(driver, family_search_id)
+                except Exception as ex:
+                    if retry >= self.max_retries:
+                        raise ex
+                    # Back off exponentially, with some jitter so the sessions don't all come back at once.
+                    time.sleep(self.backoff_seconds * (2 ** retry) * random.uniform(0.5, 1.5))
+                    retry += 1
+        finally:
+            self.release_driver(driver)
+
+    def scrape(self, family_search_id_list):
+        # Generate (family search ID, info) for each of the given persons as their pages are scraped.  They're started in
+        # the given order, but finish in whatever order that happens.  The info is None if a person couldn't be scraped
+        # even after retrying.
+        self.token_bucket = TokenBucket(self.requests_per_second)
+        with ThreadPoolExecutor(max_workers=self.session_count) as executor:
+            future_map = {executor.submit(self.scrape_person, family_search_id): family_search_id for family_search_id in family_search_id_list}
+            try:
+                for future in as_completed(future_map):
+                    family_search_id = future_map[future]
+                    try:
+                        info = future.result()
+                    except Exception as ex:
+                        print('Failed to scrape %s: %s' % (family_search_id, str(ex)))
+                        info = None
+                    yield family_search_id, info
+            finally:
+                # If the caller stopped early, don't go on to scrape persons nobody's waiting for.
+                for future in future_map:
+                    future.cancel()